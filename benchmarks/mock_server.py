@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+""" Offline stand-in for the SevenRooms API, used by the benchmarks.
+
+Implements /auth, reservations/export, clients/export, venues and venues/{id}/charges
+with cursor pagination. Rows are generated from the schemas of the tap, the number
+of rows, latency, error rates (429 / 5xx) and gzip compression are set from the command line:
+
+    python benchmarks/mock_server.py --port 8765 --rows-per-day 2000 --latency 20
+
+GET /_stats returns the number of requests served (?reset=1 resets them).
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SCHEMAS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'tap_sevenrooms', 'schemas')
+
+
+def sample_value(name, schema):
+    # Returns a value conforming to the schema of a property.
+    if 'anyOf' in schema:
+        branches = [branch for branch in schema['anyOf'] if branch.get('type') not in ('null', ['null'])]
+        return sample_value(name, branches[0]) if branches else None
+
+    types = schema.get('type', [])
+    if isinstance(types, str):
+        types = [types]
+    types = [t for t in types if t != 'null']
+    if not types:
+        return None
+
+    schema_type = types[0]
+    if schema_type == 'object':
+        return {key: sample_value(key, property_schema) for key, property_schema in schema.get('properties', {}).items()}
+    if schema_type == 'array':
+        return [sample_value(name, schema['items'])] if schema.get('items') else []
+    if schema_type == 'integer':
+        return 1
+    if schema_type == 'number':
+        return 12.5
+    if schema_type == 'boolean':
+        return True
+    if schema.get('format') == 'date-time':
+        return '2021-01-01T12:00:00Z'
+    if schema.get('format') == 'date':
+        return '2021-01-01'
+    return f'{name} value'
+
+
+def load_template(stream_name):
+    with open(os.path.join(SCHEMAS_PATH, f'{stream_name}.json')) as file:
+        schema = json.load(file)
+    return {key: sample_value(key, property_schema) for key, property_schema in schema['properties'].items()}
+
+
+def parse_date(value, default):
+    return date.fromisoformat(value[:10]) if value else default
+
+
+class MockSevenRooms:
+    """ Generated data and counters of the server """
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.templates = {name: load_template(name) for name in ('reservations', 'clients', 'venues', 'charges')}
+        self.stats = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'auth': 0, 'requests': 0, 'rows': 0, 'errors_429': 0, 'errors_5xx': 0, 'started': time.time()}
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def row(self, stream_name, prefix, day, i):
+        row = dict(self.templates[stream_name])
+        row['id'] = f'{prefix}-{day}-{i}'
+        row['updated'] = f'{day}T{(i // 60) % 24:02d}:{i % 60:02d}:00Z'
+        row['venue_group_id'] = self.args.venue_group_id
+        return row
+
+    def rows(self, stream_name, prefix, days, rows_per_day):
+        # Returns (total, get_row(index)) of the rows of days, rows are only generated for the page requested.
+        def get_row(index):
+            day = days[index // rows_per_day]
+            return self.row(stream_name, prefix, day.isoformat(), index % rows_per_day)
+        return len(days) * rows_per_day, get_row
+
+    def dated_rows(self, stream_name, prefix, rows_per_day, params):
+        if params.get('updated_since'):
+            # Only a few rows were updated since the last sync.
+            return self.rows(stream_name, prefix, [date.today()], self.args.updated_rows)
+        from_day = parse_date(params.get('from_date'), date.today())
+        to_day = parse_date(params.get('to_date'), from_day)
+        days = []
+        while from_day <= to_day:
+            days.append(from_day)
+            from_day += timedelta(days=1)
+        return self.rows(stream_name, prefix, days, rows_per_day)
+
+    def venue(self, index):
+        return dict(self.templates['venues'], id=f'venue-{index}', name=f'Venue {index}')
+
+    def data(self, route, params):
+        # Returns (data_key, total, get_row) of a route, None for an unknown route.
+        parts = route.strip('/').split('/')
+        if parts == ['reservations', 'export']:
+            return ('results',) + self.dated_rows('reservations', 'res', self.args.rows_per_day, params)
+        if parts == ['clients', 'export']:
+            return ('results',) + self.rows('clients', 'cli', [date(2021, 1, 1)], self.args.clients)
+        if parts == ['venues']:
+            return 'results', self.args.venues, self.venue
+        if len(parts) == 3 and parts[0] == 'venues' and parts[2] == 'charges':
+            return ('charges',) + self.dated_rows('charges', f'{parts[1]}-charge', self.args.charges_per_day, params)
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockSevenRooms/1.0'
+    # Headers and body are sent together, without waiting for the ack of the headers.
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.mock.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        if headers is None:
+            headers = {}
+        if self.server.mock.args.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def route(self):
+        path = urlparse(self.path).path
+        prefix = self.server.mock.args.prefix.rstrip('/')
+        if prefix and path.startswith(prefix):
+            path = path[len(prefix):]
+        return path.strip('/')
+
+    def do_POST(self):
+        mock = self.server.mock
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.route() != 'auth':
+            return self.send_json(404, {'status': 404, 'msg': 'Not found'})
+        mock.count('auth')
+        expiration = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + mock.args.token_ttl))
+        self.send_json(200, {'status': 200, 'data': {'token': f'token-{time.time()}', 'token_expiration_datetime': expiration}})
+
+    def do_GET(self):
+        mock = self.server.mock
+        args = mock.args
+        route = self.route()
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+        if route == '_stats':
+            stats = dict(mock.stats)
+            if params.get('reset'):
+                mock.reset()
+            return self.send_json(200, stats)
+
+        mock.count('requests')
+        if args.latency:
+            time.sleep(args.latency / 1000)
+        if not self.headers.get('Authorization'):
+            return self.send_json(401, {'status': 401, 'msg': 'Unauthorized'})
+
+        draw = mock.draw()
+        if draw < args.error_rate_429:
+            mock.count('errors_429')
+            return self.send_json(429, {'status': 429, 'msg': 'Too many requests'}, {'Retry-After': str(args.retry_after)})
+        if draw < args.error_rate_429 + args.error_rate_5xx:
+            mock.count('errors_5xx')
+            return self.send_json(503, {'status': 503, 'msg': 'Service unavailable'})
+
+        result = mock.data(route, params)
+        if result is None:
+            return self.send_json(404, {'status': 404, 'msg': 'Not found'})
+        data_key, total, get_row = result
+
+        # The cursor is the offset of the next page.
+        limit = min(int(params.get('limit', args.page_size)), args.page_size)
+        offset = int(params.get('cursor') or 0)
+        page = [get_row(index) for index in range(offset, min(offset + limit, total))]
+        cursor = str(offset + limit) if offset + limit < total else None
+        mock.count('rows', len(page))
+        self.send_json(200, {'status': 200, 'data': {data_key: page, 'cursor': cursor}})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='0 picks a free port')
+    parser.add_argument('--prefix', default='/api-ext/2_2', help='path of the API, base_url is http://host:port/prefix')
+    parser.add_argument('--rows-per-day', type=int, default=500, help='reservations per day')
+    parser.add_argument('--updated-rows', type=int, default=50, help='reservations returned for updated_since')
+    parser.add_argument('--clients', type=int, default=5000, help='rows of clients/export')
+    parser.add_argument('--venues', type=int, default=5)
+    parser.add_argument('--charges-per-day', type=int, default=20, help='charges per venue and day')
+    parser.add_argument('--page-size', type=int, default=400, help='maximum rows per page')
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to each request')
+    parser.add_argument('--error-rate-429', type=float, default=0, help='share of requests answered with a 429')
+    parser.add_argument('--error-rate-5xx', type=float, default=0, help='share of requests answered with a 503')
+    parser.add_argument('--retry-after', type=float, default=0, help='Retry-After of the 429 responses, in seconds')
+    parser.add_argument('--token-ttl', type=float, default=3600, help='seconds before a token expires')
+    parser.add_argument('--gzip', action='store_true', help='gzip the responses when the client accepts it')
+    parser.add_argument('--venue-group-id', default='venue-group')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def make_server(args):
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    server.mock = MockSevenRooms(args)
+    return server
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = make_server(args)
+    host, port = server.server_address[:2]
+    # Read by benchmarks/run.py to find the port picked.
+    print(f'listening on http://{host}:{port}{args.prefix}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
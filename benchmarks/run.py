@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+""" End to end throughput benchmarks of the tap against benchmarks/mock_server.py.
+
+Each scenario starts a mock server, runs the tap in a subprocess and reports the
+records/sec, requests/sec, time to first record and peak RSS of the tap:
+
+    python benchmarks/run.py
+    python benchmarks/run.py --scenario incremental --set day_workers=4 --latency 20
+
+The records are read from the stdout of the tap and dropped.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MOCK_SERVER = os.path.join(ROOT, 'benchmarks', 'mock_server.py')
+
+# Streams selected, config of the tap and arguments of the mock server of each scenario.
+SCENARIOS = {
+    'full_table': {
+        'description': 'clients and venues, FULL_TABLE',
+        'streams': ['clients', 'venues'],
+        'config': {},
+        'server': ['--clients', '10000'],
+    },
+    'incremental': {
+        'description': 'reservations, one request per day over 14 days',
+        'streams': ['reservations'],
+        'config': {'days': 14},
+        'server': ['--rows-per-day', '2000'],
+    },
+    'incremental_windows': {
+        'description': 'reservations, adaptive windows over 60 days',
+        'streams': ['reservations'],
+        'config': {'days': 60, 'adaptive_windows': True},
+        'server': ['--rows-per-day', '300'],
+    },
+    'children': {
+        'description': 'venues and their charges over 14 days',
+        'streams': ['venues', 'charges'],
+        'config': {'days': 14},
+        'server': ['--venues', '10', '--charges-per-day', '100'],
+    },
+}
+
+
+def start_server(server_args):
+    process = subprocess.Popen([sys.executable, MOCK_SERVER, '--port', '0'] + server_args, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('listening on '):
+        process.kill()
+        raise Exception(f'Mock server failed to start: {line!r}')
+    return process, line[len('listening on '):].strip()
+
+
+def server_stats(base_url, reset=False):
+    scheme, _, host = base_url.split('/')[:3]
+    with urllib.request.urlopen(f'{scheme}//{host}/_stats' + ('?reset=1' if reset else '')) as res:
+        return json.loads(res.read())
+
+
+def write_catalog(path, streams):
+    sys.path.insert(0, ROOT)
+    from tap_sevenrooms import discover
+
+    catalog = discover().to_dict()
+    for stream in catalog['streams']:
+        for entry in stream['metadata']:
+            if not entry['breadcrumb']:
+                entry['metadata']['selected'] = stream['tap_stream_id'] in streams
+    with open(path, 'w') as file:
+        json.dump(catalog, file)
+
+
+def run_tap(config_path, catalog_path, log_path):
+    # Returns the number of records, seconds to the first record, total seconds and peak RSS (bytes) of the tap.
+    command = [sys.executable, '-c', 'import tap_sevenrooms; tap_sevenrooms.main()', '--config', config_path, '--catalog', catalog_path]
+    with open(log_path, 'w') as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=log)
+        records = 0
+        first_record = None
+        for line in process.stdout:
+            if line.startswith(b'{"type":"RECORD"') or line.startswith(b'{"type": "RECORD"'):
+                if first_record is None:
+                    first_record = time.perf_counter() - started
+                records += 1
+        # wait4 gives the resource usage of this process only, not of the mock server.
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode != 0:
+        raise Exception(f'The tap failed with exit code {process.returncode}, see {log_path}')
+    return records, first_record, elapsed, usage.ru_maxrss * 1024
+
+
+def run_scenario(name, args, work_dir):
+    scenario = SCENARIOS[name]
+    server_args = scenario['server'] + [
+        '--latency', str(args.latency),
+        '--error-rate-429', str(args.error_rate_429),
+        '--error-rate-5xx', str(args.error_rate_5xx),
+    ] + (['--gzip'] if args.gzip else [])
+    server, base_url = start_server(server_args)
+    try:
+        scenario_config = dict(scenario['config'])
+        days = scenario_config.pop('days', 1)
+        end_date = date.today() - timedelta(days=1)
+        config = {
+            'base_url': base_url,
+            'client_id': 'benchmark',
+            'client_secret': 'benchmark',
+            'venue_group_id': 'venue-group',
+            'start_date': (end_date - timedelta(days=days - 1)).isoformat(),
+            'end_date': end_date.isoformat(),
+            # The mock server has no rate limit.
+            'rate_limit': 1000,
+            'max_rate_limit': 10000,
+        }
+        config.update(scenario_config)
+        config.update(args.config)
+
+        config_path = os.path.join(work_dir, f'{name}_config.json')
+        catalog_path = os.path.join(work_dir, f'{name}_catalog.json')
+        log_path = os.path.join(work_dir, f'{name}.log')
+        with open(config_path, 'w') as file:
+            json.dump(config, file)
+        write_catalog(catalog_path, scenario['streams'])
+
+        results = []
+        for _ in range(args.repeat):
+            server_stats(base_url, reset=True)
+            records, first_record, elapsed, peak_rss = run_tap(config_path, catalog_path, log_path)
+            stats = server_stats(base_url)
+            results.append({
+                'scenario': name,
+                'records': records,
+                'seconds': round(elapsed, 3),
+                'records_per_sec': round(records / elapsed, 1),
+                'requests': stats['requests'],
+                'requests_per_sec': round(stats['requests'] / elapsed, 1),
+                'time_to_first_record': round(first_record, 3) if first_record is not None else None,
+                'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+            })
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def print_table(results):
+    columns = ['scenario', 'records', 'seconds', 'records_per_sec', 'requests', 'requests_per_sec', 'time_to_first_record', 'peak_rss_mb']
+    widths = {column: max(len(column), *(len(str(result[column])) for result in results)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(widths[column]) for column in columns))
+
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='scenario to run, all by default (repeatable)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each scenario')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='config of the tap (ex: day_workers=4)')
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to each request by the mock server')
+    parser.add_argument('--error-rate-429', type=float, default=0)
+    parser.add_argument('--error-rate-5xx', type=float, default=0)
+    parser.add_argument('--gzip', action='store_true', help='gzip the responses of the mock server')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON lines')
+    parser.add_argument('--work-dir', help='directory of the configs, catalogs and logs of the tap (a temporary one by default)')
+    args = parser.parse_args(argv)
+
+    args.config = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        args.config[key] = parse_value(value)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = args.scenario or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        results = []
+        for name in scenarios:
+            print(f'{name}: {SCENARIOS[name]["description"]}', file=sys.stderr)
+            results += run_scenario(name, args, work_dir)
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,10 @@ setup(
         "singer-python",
         "requests",
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "fast": ["orjson"],
+    },
     entry_points="""
     [console_scripts]
     tap-sevenrooms=tap_sevenrooms:main
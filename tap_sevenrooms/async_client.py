@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+import json
+import singer
+import backoff
+
+from .client import (
+    SevenRoomsClient,
+    SevenroomClientError,
+    SevenroomInternalServiceError,
+    SevenroomTooManyRequestsError,
+    raise_request_error
+)
+from .metrics import endpoint_tags, on_backoff, HTTP_REQUEST_DURATION, PARSE_DURATION, RATE_LIMITED_DURATION
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+logger = singer.get_logger()
+
+
+class AsyncSevenRoomsClient(SevenRoomsClient):
+    """ SevenRoomsClient running its requests on an asyncio event loop.
+
+    The loop runs in a background thread, get_data keeps the blocking contract of
+    SevenRoomsClient so it can be called from any number of sync workers, each call
+    being a coroutine scheduled on the loop. Up to max_connections requests are in flight.
+    """
+
+    def __init__(self, config=None):
+        if aiohttp is None:
+            raise Exception('aiohttp is required for the async http_engine, install tap-sevenrooms[async].')
+
+        super().__init__(config=config)
+
+        # Seconds a connection is kept open waiting for the next request.
+        self.keepalive_timeout = float(config.get('keepalive_timeout', 30))
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name='sevenrooms-http', daemon=True)
+        self.loop_thread.start()
+
+        try:
+            self.run(self.connect())
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+
+        logger.info('client connected')
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if getattr(self, 's', None) is not None:
+            self.run(self.s.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        logger.info("client closed")
+
+    def run(self, coroutine):
+        # Blocks the calling thread until the coroutine has run on the client loop.
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def connect(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout)
+        self.s = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                                       headers={'Accept-Encoding': 'gzip, deflate'})
+
+        await self.authenticate_async()
+
+    def new_token_lock(self):
+        # Only used on the client loop.
+        return asyncio.Lock()
+
+    def authenticate(self, force=False):
+        self.run(self.authenticate_async(force))
+
+    async def authenticate_async(self, force=False):
+        if not force and self.load_cached_token():
+            return
+
+        async with self.s.post(f'{self.base_url}/auth', data=dict(client_id=self.client_id, client_secret=self.client_secret)) as res:
+            text = await res.text()
+
+            # An exception can be raised here.
+            if res.status != 200:
+                raise_request_error(res.status, text)
+
+        self.set_token(json.loads(text)['data'])
+
+    async def get_token_async(self):
+        # Same as SevenRoomsClient.get_token.
+        if self.token_expiring():
+            async with self.token_lock:
+                if self.token_expiring():
+                    logger.info('token expiring, authenticating again')
+                    await self.authenticate_async(force=True)
+        return self.api_token
+
+    async def refresh_token_async(self, rejected_token):
+        async with self.token_lock:
+            if self.api_token == rejected_token:
+                logger.info('token rejected, authenticating again')
+                await self.authenticate_async(force=True)
+
+    def fetch_data(self, route, params):
+        return self.run(self.fetch_data_async(route, params))
+
+    # Same retry and rate limit policy as SevenRoomsClient.fetch_data.
+    @backoff.on_exception(backoff.expo,
+                          (SevenroomInternalServiceError, aiohttp.ClientConnectionError, asyncio.TimeoutError) if aiohttp else SevenroomClientError,
+                          max_tries=7,
+                          factor=3,
+                          on_backoff=on_backoff)
+    @backoff.on_exception(backoff.constant,
+                          SevenroomTooManyRequestsError,
+                          max_tries=10,
+                          interval=0,
+                          on_backoff=on_backoff)
+    async def fetch_data_async(self, route, params):
+        endpoint, stream = endpoint_tags(route)
+        await self.wait_rate_limit_async(endpoint, stream)
+
+        # We will always be using GET, as we have no need to push info upstream.
+        token = await self.get_token_async()
+        status, headers, text = await self.send_request_async(route, params, token, endpoint, stream)
+
+        if status == 401:
+            # The token expired or was revoked, the request is retried once with a new one.
+            await self.refresh_token_async(token)
+            await self.wait_rate_limit_async(endpoint, stream)
+            status, headers, text = await self.send_request_async(route, params, self.api_token, endpoint, stream)
+
+        logger.info(f'Sevenroom API request /{route} -- response status: {status}')
+        if status == 200:
+            self.rate_limiter.on_success(headers)
+
+            try:
+                with self.metrics.timer(PARSE_DURATION, stream=stream, endpoint=endpoint):
+                    res_data = json.loads(text).get('data')
+            except ValueError:
+                raise_request_error(status, text)
+
+            if not res_data:
+                raise_request_error(status, text)
+
+            return res_data
+        else:
+            if status == 429:
+                self.rate_limiter.on_throttle(headers)
+            raise_request_error(status, text)
+
+    async def wait_rate_limit_async(self, endpoint, stream):
+        waited = await self.rate_limiter.acquire_async()
+        if waited > 0:
+            self.metrics.increment(RATE_LIMITED_DURATION, waited, stream=stream, endpoint=endpoint)
+
+    async def send_request_async(self, route, params, token, endpoint, stream):
+        started = time.perf_counter()
+        async with self.s.get(f'{self.base_url}/{route}', params=params, headers=dict(Authorization=token)) as res:
+            text = await res.text()
+        self.metrics.observe(HTTP_REQUEST_DURATION, time.perf_counter() - started, stream=stream, endpoint=endpoint, http_status_code=res.status)
+        return res.status, res.headers, text
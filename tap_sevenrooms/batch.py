@@ -0,0 +1,109 @@
+import gzip
+import os
+import time
+
+from .output import MessageWriter
+
+
+class Batch:
+    """ A gzip compressed JSONL file of records being written """
+
+    def __init__(self, path, compresslevel):
+        self.path = path
+        self.raw = open(path, 'wb')
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=compresslevel)
+        self.records = 0
+
+    def write(self, data, records):
+        self.file.write(data)
+        self.records += records
+
+    @property
+    def size(self):
+        # Compressed bytes written so far.
+        return self.raw.tell()
+
+    def close(self):
+        self.file.close()
+        self.raw.close()
+
+
+class BatchWriter(MessageWriter):
+    """ MessageWriter writing the records to files instead of RECORD messages.
+
+    The records of each stream are written to gzip compressed JSONL files in batch_dir,
+    a file is complete once it reaches file_size compressed bytes (or the sync ends) and
+    a BATCH message referencing it is written (singer-sdk format). SCHEMA and STATE
+    messages are written to stdout as usual, but a state is held while files are being
+    written and only written once they are complete: all the open files are completed
+    together, so the state never covers records of a file the target hasn't received.
+    """
+
+    def __init__(self, batch_dir, file_size=100 * 1024 * 1024, compresslevel=6, **kwargs):
+        super().__init__(**kwargs)
+        self.batch_dir = os.path.abspath(os.path.expanduser(batch_dir))
+        self.file_size = file_size
+        self.compresslevel = compresslevel
+        os.makedirs(self.batch_dir, exist_ok=True)
+
+        self.batches = {}
+        self.sequence = 0
+        # Files of previous runs are never overwritten.
+        self.run_id = f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}'
+
+    @classmethod
+    def from_config(cls, config, out=None, metrics=None):
+        return super().from_config(
+            config,
+            out=out,
+            metrics=metrics,
+            batch_dir=config['batch_dir'],
+            file_size=int(config.get('batch_file_size', 100 * 1024 * 1024)),
+            compresslevel=int(config.get('batch_compresslevel', 6))
+        )
+
+    def encode_records(self, stream_name, records):
+        # JSONL lines of the records.
+        encode = self.encode
+        return b''.join([encode(record) + b'\n' for record in records])
+
+    def _write_records(self, stream_name, data, count):
+        batch = self.batches.get(stream_name)
+        if batch is None:
+            batch = self.batches[stream_name] = self._open_batch(stream_name)
+        batch.write(data, count)
+        if batch.size >= self.file_size:
+            self._complete_batches()
+
+    def _open_batch(self, stream_name):
+        self.sequence += 1
+        path = os.path.join(self.batch_dir, f'{stream_name}-{self.run_id}-{self.sequence:05d}.jsonl.gz')
+        return Batch(path, self.compresslevel)
+
+    def _complete_batches(self):
+        for stream_name, batch in self.batches.items():
+            batch.close()
+            self.write_message({
+                'type': 'BATCH',
+                'stream': stream_name,
+                'encoding': {'format': 'jsonl', 'compression': 'gzip'},
+                'manifest': [f'file://{batch.path}'],
+            })
+        self.batches = {}
+        # The state held covers records of the files just completed at most.
+        self._write_pending_state(time.monotonic())
+        self._flush_buffer()
+
+    def write_state(self, state):
+        with self.lock:
+            if self.batches:
+                # Written once the open files are complete.
+                self.pending_state = state
+            else:
+                super().write_state(state)
+
+    def flush(self):
+        with self.lock:
+            if self.batches:
+                self._complete_batches()
+            super().flush()
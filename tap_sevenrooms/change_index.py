@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+import singer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LOGGER = singer.get_logger()
+
+# Keys looked up in the index per query.
+INDEX_QUERY_SIZE = 500
+
+# Property of the tombstone records, as in the Stitch convention.
+DELETED_AT = '_sdc_deleted_at'
+
+
+def _canonical_json(record):
+    # Same bytes for the same content whatever the order of the keys.
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(record, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class RowHashIndex:
+    """ Index of the rows of a FULL_TABLE stream loaded by the target, in a SQLite file.
+
+    Each row is stored as its key_properties and a 128 bits hash of its content, filter()
+    only returns the rows new or changed since the index. The rows of a run are staged
+    under a generation id, written in the state by save() once the stream has been
+    written. They are only merged into the index by promote() when a later run starts
+    with that state, handed back by the orchestrator once the target loaded the rows;
+    the rows staged by other runs (failed, or which state the target never committed)
+    are discarded, so their rows are emitted again. When every row of the stream was
+    received, the rows gone are removed from the index on promotion and, with
+    tombstones, emitted as records with their keys and _sdc_deleted_at.
+    The indexes of every stream and venue group share the file.
+    """
+
+    def __init__(self, path, stream_name, key_properties, namespace=None, tombstones=False):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.stream_name = stream_name
+        self.key_properties = list(key_properties)
+        self.namespace = f'{namespace}/{stream_name}' if namespace else stream_name
+        self.tombstones = tombstones
+        self.generation = uuid.uuid4().hex
+
+        self.changed = 0
+        self.unchanged = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Streams synced at the same time have their own connection, writes are short transactions.
+        self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS rows (namespace TEXT, key TEXT, hash BLOB, PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE IF NOT EXISTS pending '
+                            '(namespace TEXT, generation TEXT, key TEXT, hash BLOB, PRIMARY KEY (namespace, generation, key)) WITHOUT ROWID')
+
+    @classmethod
+    def from_config(cls, config, state, stream_name, key_properties, endpoint_config):
+        # Returns None when no change_index_path is set or the stream isn't FULL_TABLE with key properties.
+        if not config.get('change_index_path') or endpoint_config.get('replication_method') != 'FULL_TABLE' or not key_properties:
+            return None
+        index = cls(
+            config['change_index_path'],
+            stream_name,
+            key_properties,
+            namespace=config.get('venue_group_id'),
+            tombstones=bool(config.get('change_tombstones'))
+        )
+        index.promote(state.get('change_index', {}).get(stream_name))
+        return index
+
+    def schema_with_tombstones(self, schema):
+        """ Returns the schema of the stream, with the _sdc_deleted_at property of the tombstones """
+        if not self.tombstones or DELETED_AT in schema.get('properties', {}):
+            return schema
+        schema = dict(schema)
+        schema['properties'] = dict(schema.get('properties', {}), **{DELETED_AT: {'type': ['null', 'string'], 'format': 'date-time'}})
+        return schema
+
+    def key(self, record):
+        return json.dumps([record.get(key) for key in self.key_properties], separators=(',', ':'), default=str)
+
+    def filter(self, records):
+        """ Returns the records new or changed since the previous runs, in order """
+        keys = [self.key(record) for record in records]
+        hashes = [hashlib.blake2b(_canonical_json(record), digest_size=16).digest() for record in records]
+
+        # Hashes of the previous runs, looked up by batch.
+        previous = {}
+        unique_keys = list(set(keys))
+        for i in range(0, len(unique_keys), INDEX_QUERY_SIZE):
+            chunk = unique_keys[i:i + INDEX_QUERY_SIZE]
+            query = 'SELECT key, hash FROM rows WHERE namespace = ? AND key IN ({})'.format(','.join('?' * len(chunk)))
+            previous.update(self.db.execute(query, [self.namespace] + chunk))
+
+        changed_records = [record for record, key, digest in zip(records, keys, hashes) if previous.get(key) != digest]
+        self.changed += len(changed_records)
+        self.unchanged += len(records) - len(changed_records)
+
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?)',
+                                ((self.namespace, self.generation, key, digest) for key, digest in zip(keys, hashes)))
+        return changed_records
+
+    def deleted_records(self, batch_size=INDEX_QUERY_SIZE):
+        """ Yields the tombstones of the rows of the index not received during the run, by batch """
+        deleted_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        cursor = self.db.execute(
+            'SELECT key FROM rows WHERE namespace = ? AND key NOT IN (SELECT key FROM pending WHERE namespace = ? AND generation = ?)',
+            (self.namespace, self.namespace, self.generation)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(zip(self.key_properties, json.loads(key)), **{DELETED_AT: deleted_at}) for key, in rows]
+
+    def promote(self, saved):
+        """ Merges the rows staged by the run which state the sync starts from into the index, discards the others
+
+        saved is the {'generation', 'complete'} written in the state by save(), None if the state has none.
+        """
+        generation = saved['generation'] if saved else None
+        deleted = promoted = 0
+        with self.db:
+            discarded = self.db.execute('DELETE FROM pending WHERE namespace = ? AND generation IS NOT ?', (self.namespace, generation)).rowcount
+            # Nothing staged when the generation was already promoted, or discarded by a run the target never committed.
+            staged = self.db.execute('SELECT 1 FROM pending WHERE namespace = ? AND generation = ? LIMIT 1', (self.namespace, generation)).fetchone()
+            if staged:
+                if saved.get('complete'):
+                    deleted = self.db.execute(
+                        'DELETE FROM rows WHERE namespace = ? AND key NOT IN (SELECT key FROM pending WHERE namespace = ? AND generation = ?)',
+                        (self.namespace, self.namespace, generation)
+                    ).rowcount
+                promoted = self.db.execute(
+                    'INSERT OR REPLACE INTO rows SELECT namespace, key, hash FROM pending WHERE namespace = ? AND generation = ?',
+                    (self.namespace, generation)
+                ).rowcount
+                self.db.execute('DELETE FROM pending WHERE namespace = ?', (self.namespace,))
+        if promoted or deleted or discarded:
+            LOGGER.info(f'Stream: {self.stream_name}, change index: {promoted} rows promoted, {deleted} deleted, {discarded} discarded')
+
+    def save(self, state, complete):
+        """ Writes the generation of the rows staged by the run in the state, called once they have all been written """
+        state.setdefault('change_index', {})[self.stream_name] = {'generation': self.generation, 'complete': complete}
+        LOGGER.info(f'Stream: {self.stream_name}, {self.changed} new or changed rows emitted, {self.unchanged} unchanged')
+
+    def close(self):
+        self.db.close()
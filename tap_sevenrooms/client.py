@@ -1,12 +1,34 @@
+import copy
+import json
+import threading
+import time
 from datetime import datetime
 import singer
 import backoff
 import requests
 from requests import Response
+from .metrics import (
+    SyncMetrics,
+    endpoint_tags,
+    on_backoff,
+    HTTP_REQUEST_DURATION,
+    PAGE_ROWS,
+    PARSE_DURATION,
+    RATE_LIMITED_DURATION,
+    ROWS_BUCKETS,
+    TRANSFORM_DURATION
+)
+from .rate_limit import AdaptiveRateLimiter
+from .response_cache import ResponseCache
+from .token_cache import TokenCache, parse_token_expiry
 
 
 logger = singer.get_logger()
 
+# Number of rows requested per page, and maximum number of pages synced for a request.
+PAGE_LIMIT = 400
+MAX_PAGE = 30
+
 
 class SevenroomClientError(Exception):
     pass
@@ -49,6 +71,11 @@ class SevenroomInternalServiceError(SevenroomClientError):
     pass
 
 
+class SevenroomMaxPageError(SevenroomClientError):
+    # More pages are available than MAX_PAGE
+    pass
+
+
 # https://api-docs.sevenrooms.com/getting-started/api-status-codes
 ERROR_CODE_EXCEPTION_MAPPING = {
     400: SevenroomBadRequestError,
@@ -61,21 +88,36 @@ ERROR_CODE_EXCEPTION_MAPPING = {
 }
 
 
-def handle_request_error(res: Response):
-    if type(res) is not Response:
-        raise Exception(f'Response from request is of type {type(res)} -- should be Request')
-
-    if res.status_code >= 500:
+def raise_request_error(status_code, text):
+    if status_code >= 500:
         exception = SevenroomInternalServiceError
     else:
-        exception = ERROR_CODE_EXCEPTION_MAPPING.get(res.status_code, SevenroomClientError)
+        exception = ERROR_CODE_EXCEPTION_MAPPING.get(status_code, SevenroomClientError)
 
     try:
-        response = res.json()
+        response = json.loads(text)
     except ValueError:
-        raise exception(f'{res.status_code} --- Response not JSON: {res.text}')
+        raise exception(f'{status_code} --- Response not JSON: {text}')
+
+    raise exception(f'{status_code} --- {response.get("msg", "no error message in response")}')
+
+
+def handle_request_error(res: Response):
+    if type(res) is not Response:
+        raise Exception(f'Response from request is of type {type(res)} -- should be Request')
+
+    raise_request_error(res.status_code, res.text)
 
-    raise exception(f'{res.status_code} --- {response.get("msg", "no error message in response")}')
+
+def get_client(config):
+    """ Returns the client for the http_engine set in the config, 'requests' (default) or 'async' """
+    http_engine = config.get('http_engine', 'requests') if config else 'requests'
+    if http_engine == 'async':
+        from .async_client import AsyncSevenRoomsClient
+        return AsyncSevenRoomsClient(config=config)
+    if http_engine != 'requests':
+        raise Exception(f'Unknown http_engine: {http_engine}')
+    return SevenRoomsClient(config=config)
 
 
 class SevenRoomsClient:
@@ -88,45 +130,173 @@ class SevenRoomsClient:
         if 'client_id' not in config or 'client_secret' not in config:
             raise Exception('No client ID or Secret provided')
 
+        self.config = config
         self.client_id = config['client_id']
         self.client_secret = config['client_secret']
         self.base_url = config.get('base_url', 'https://demo.sevenrooms.com/api-ext/2_2')
 
-    def __enter__(self):
-        res = requests.post(f'{self.base_url}/auth', data=dict(client_id=self.client_id, client_secret=self.client_secret))
+        # Size of the connection pool, should be at least the number of workers used during the sync.
+        self.max_connections = int(config.get('max_connections', 10))
 
-        # An exception can be raised here.
-        if res.status_code != 200:
-            handle_request_error(res)
+        # Seconds before a request is abandoned (and retried).
+        self.request_timeout = float(config.get('request_timeout', 300))
 
-        logger.info('client connected')
+        # Shared by all the workers, adapts the request rate to the 429 and rate limit headers returned.
+        self.rate_limiter = AdaptiveRateLimiter.from_config(config)
+
+        # Tokens are reused across runs when a cache file is set, and renewed token_refresh_margin seconds before they expire.
+        self.token_cache = TokenCache(config['token_cache_path']) if config.get('token_cache_path') else None
+        self.token_refresh_margin = float(config.get('token_refresh_margin', 300))
+        self.api_token = None
+        self.token_expires_at = None
+        self.token_lock = self.new_token_lock()
+
+        # Timings and counts of the requests, shared by the clients of every credentials.
+        self.metrics = SyncMetrics.from_config(config)
 
-        api_token = res.json()['data']['token']
+        # Responses read from disk instead of the API, when a response_cache_path is set.
+        self.response_cache = ResponseCache.from_config(config)
+
+    def __enter__(self):
         self.s = requests.Session()
-        self.s.headers.update(dict(Authorization=api_token))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_connections, pool_maxsize=self.max_connections)
+        self.s.mount('http://', adapter)
+        self.s.mount('https://', adapter)
+        self.s.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        try:
+            self.authenticate()
+        except Exception:
+            self.s.close()
+            raise
+
+        logger.info('client connected')
 
         return self
 
+    def new_token_lock(self):
+        return threading.Lock()
+
+    def authenticate(self, force=False):
+        if not force and self.load_cached_token():
+            return
+
+        res = self.s.post(f'{self.base_url}/auth', data=dict(client_id=self.client_id, client_secret=self.client_secret), timeout=self.request_timeout)
+
+        # An exception can be raised here.
+        if res.status_code != 200:
+            handle_request_error(res)
+
+        self.set_token(res.json()['data'])
+
+    def token_cache_key(self):
+        return TokenCache.key(self.base_url, self.client_id, self.client_secret)
+
+    def load_cached_token(self):
+        if self.token_cache is None:
+            return False
+        cached = self.token_cache.get(self.token_cache_key(), margin=self.token_refresh_margin)
+        if cached is None:
+            return False
+        self.api_token, self.token_expires_at = cached
+        logger.info('using cached token')
+        return True
+
+    def set_token(self, data):
+        # Sent with each request rather than set on the session, clients with other credentials share the session.
+        self.api_token = data['token']
+        self.token_expires_at = parse_token_expiry(data)
+        if self.token_cache is not None:
+            self.token_cache.set(self.token_cache_key(), self.api_token, self.token_expires_at)
+
+    def token_expiring(self):
+        return self.token_expires_at is not None and self.token_expires_at - self.token_refresh_margin <= time.time()
+
+    def get_token(self):
+        # Renews the token before it expires, once for all the workers.
+        if self.token_expiring():
+            with self.token_lock:
+                if self.token_expiring():
+                    logger.info('token expiring, authenticating again')
+                    self.authenticate(force=True)
+        return self.api_token
+
+    def refresh_token(self, rejected_token):
+        # Called on a 401, the token is renewed unless another worker already did.
+        with self.token_lock:
+            if self.api_token == rejected_token:
+                logger.info('token rejected, authenticating again')
+                self.authenticate(force=True)
+
+    def with_credentials(self, client_id, client_secret):
+        """ Returns a client authenticated with other credentials, sharing the connection pool of this one """
+        if client_id == self.client_id and client_secret == self.client_secret:
+            return self
+
+        client = copy.copy(self)
+        client.client_id = client_id
+        client.client_secret = client_secret
+        # The API rate limits each set of credentials.
+        client.rate_limiter = AdaptiveRateLimiter.from_config(self.config)
+        client.token_lock = client.new_token_lock()
+        client.authenticate()
+        logger.info(f'client connected with client ID {client_id}')
+        return client
+
     def __exit__(self, type, value, traceback):
         self.s.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
         logger.info("client closed")
 
+    def get_data(self, route, params):
+        if self.response_cache is None:
+            return self.fetch_data(route, params)
+
+        key = ResponseCache.key(self.base_url, self.client_id, route, params)
+        res_data = self.response_cache.get(key)
+        if res_data is None:
+            res_data = self.fetch_data(route, params)
+            self.response_cache.set(key, route, params, res_data)
+        else:
+            logger.info(f'Sevenroom API request /{route} -- read from the response cache')
+        return res_data
+
     # Rate limiting
     # No official rate limit is defined in the Sevenrooms API however the precense of code 429 in the doc indicates a limit is present.
+    # The rate limiter already waits and slows down after a 429, so those are retried without an extra backoff.
     @backoff.on_exception(backoff.expo,
-                          (SevenroomInternalServiceError, requests.exceptions.ConnectionError, requests.exceptions.Timeout, SevenroomTooManyRequestsError),
+                          (SevenroomInternalServiceError, requests.exceptions.ConnectionError, requests.exceptions.Timeout),
                           max_tries=7,
-                          factor=3)
-    @singer.utils.ratelimit(600, 60)
-    def get_data(self, route, params):
+                          factor=3,
+                          on_backoff=on_backoff)
+    @backoff.on_exception(backoff.constant,
+                          SevenroomTooManyRequestsError,
+                          max_tries=10,
+                          interval=0,
+                          on_backoff=on_backoff)
+    def fetch_data(self, route, params):
+        endpoint, stream = endpoint_tags(route)
+        self.wait_rate_limit(endpoint, stream)
+
         # We will always be using GET, as we have no need to push info upstream.
-        res = self.s.get(f'{self.base_url}/{route}', params=params)
+        token = self.get_token()
+        res = self.send_request(route, params, token, endpoint, stream)
+
+        if res.status_code == 401:
+            # The token expired or was revoked, the request is retried once with a new one.
+            res.close()
+            self.refresh_token(token)
+            self.wait_rate_limit(endpoint, stream)
+            res = self.send_request(route, params, self.api_token, endpoint, stream)
 
         logger.info(f'Sevenroom API request /{route} -- response status: {res.status_code}')
         if res.status_code == 200:
+            self.rate_limiter.on_success(res.headers)
 
             try:
-                res_data = res.json().get('data')
+                with self.metrics.timer(PARSE_DURATION, stream=stream, endpoint=endpoint):
+                    res_data = res.json().get('data')
             except ValueError:
                 handle_request_error(res)
 
@@ -135,9 +305,31 @@ class SevenRoomsClient:
 
             return res_data
         else:
+            if res.status_code == 429:
+                self.rate_limiter.on_throttle(res.headers)
             handle_request_error(res)
 
-    def request_data(self, stream=None, endpoint=None, data_key=None, day=None, use_dates=True, additional_params=None):
+    def wait_rate_limit(self, endpoint, stream):
+        waited = self.rate_limiter.acquire()
+        if waited > 0:
+            self.metrics.increment(RATE_LIMITED_DURATION, waited, stream=stream, endpoint=endpoint)
+
+    def send_request(self, route, params, token, endpoint, stream):
+        started = time.perf_counter()
+        res = self.s.get(f'{self.base_url}/{route}', params=params, headers=dict(Authorization=token), timeout=self.request_timeout)
+        self.metrics.observe(HTTP_REQUEST_DURATION, time.perf_counter() - started, stream=stream, endpoint=endpoint, http_status_code=res.status_code)
+        return res
+
+    def request_pages(self, stream=None, endpoint=None, data_key=None, day=None, use_dates=True, additional_params=None, end_day=None, raise_on_max_page=False,
+                      cursor=None, page=1, transformer=None, max_page=MAX_PAGE):
+        """ Yield the parsed rows of each page (as a Page) as soon as the page is received
+
+        Rows are converted to records by the transformer (a RecordTransformer) if one is given, with parse_results otherwise.
+        The dates requested are from day to end_day (defaults to day). Pages are requested up to max_page, or up to
+        the last page when max_page is None. The rows past max_page are dropped, unless raise_on_max_page is set:
+        SevenroomMaxPageError is raised instead.
+        cursor and page resume the request from a checkpoint, it restarts from the first page if the cursor is refused.
+        """
 
         if not stream or not endpoint:
             raise SevenroomClientError('No stream or endpoint sent to client for request.')
@@ -151,43 +343,88 @@ class SevenRoomsClient:
         if not data_key:
             data_key = 'results'
 
-        data = []
         date = day.strftime("%Y-%m-%d")
         date_time = day.strftime("%Y-%m-%d 00:00")
-        logger.info(f"Request for date {date}")
+        end_date = end_day.strftime("%Y-%m-%d") if end_day else date
+        if end_date != date:
+            logger.info(f"Request for dates {date} to {end_date}")
+        else:
+            logger.info(f"Request for date {date}")
 
-        params = dict(limit=400)
+        params = dict(limit=PAGE_LIMIT)
 
         if additional_params:
             params.update(additional_params)
 
         if use_dates:
-            params['to_date'] = date
+            params['to_date'] = end_date
             params['from_date'] = date
 
-        page = 1
-        max_page = 30
+        if cursor:
+            logger.info(f"Resuming from page {page}")
+            params['cursor'] = cursor
+        resumed = bool(cursor)
+
         # Loop until cursor returns nothing
-        while page <= max_page:
+        while max_page is None or page <= max_page:
             logger.info(f"...page {page}...")
 
-            res = self.get_data(endpoint, params)
+            try:
+                res = self.get_data(endpoint, params)
+            except SevenroomBadRequestError:
+                if not resumed:
+                    raise
+                # The cursor of the checkpoint has expired.
+                logger.info("Cursor refused, restarting from the first page")
+                resumed = False
+                params.pop('cursor')
+                page = 1
+                continue
+            resumed = False
 
             if data_key not in res or not res[data_key]:
                 break
 
-            data += parse_results(res[data_key], date_time)
+            next_cursor = res.get('cursor') or None
+            with self.metrics.timer(TRANSFORM_DURATION, stream=stream.tap_stream_id):
+                if transformer:
+                    rows = transformer.transform(res[data_key], date_time)
+                else:
+                    rows = parse_results(res[data_key], date_time)
+            self.metrics.observe(PAGE_ROWS, len(rows), buckets=ROWS_BUCKETS, stream=stream.tap_stream_id, endpoint=endpoint_tags(endpoint)[0])
+            yield Page(rows, page, next_cursor)
             page += 1
 
-            if 'cursor' not in res or not res['cursor']:
+            if not next_cursor:
                 break
 
-            params['cursor'] = res['cursor']
-
-        if page == max_page:
-            logger.info('Max page 30/30 reached, no more data being synced.')
-
-        return data
+            params['cursor'] = next_cursor
+        else:
+            if raise_on_max_page:
+                raise SevenroomMaxPageError(f'Max page {max_page}/{max_page} reached for {endpoint} from {date} to {end_date}')
+            logger.info(f'Max page {max_page}/{max_page} reached, no more data being synced.')
+
+    def request_data(self, stream=None, endpoint=None, data_key=None, day=None, use_dates=True, additional_params=None, transformer=None):
+        """ Yield parsed rows one page at a time, only one page is held in memory """
+        for page in self.request_pages(
+            stream=stream,
+            endpoint=endpoint,
+            data_key=data_key,
+            day=day,
+            use_dates=use_dates,
+            additional_params=additional_params,
+            transformer=transformer
+        ):
+            yield from page
+
+
+class Page(list):
+    """ Parsed rows of a page, with its number and the cursor of the next page (None for the last page) """
+
+    def __init__(self, rows, number, cursor):
+        super().__init__(rows)
+        self.number = number
+        self.cursor = cursor
 
 
 def parse_results(result, date):
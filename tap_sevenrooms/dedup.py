@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Digests looked up in the spill file per query.
+SPILL_QUERY_SIZE = 500
+
+
+class RecordDeduplicator:
+    """ Drops the records already written during the run.
+
+    A record is identified by its key_properties and replication key (updated), a row
+    updated again is kept. Each identity is stored as a 64 bits digest in a set holding
+    at most max_memory_keys digests, the set is then spilled to a SQLite file (in
+    spill_dir) and emptied, so memory stays bounded whatever the number of records.
+    """
+
+    def __init__(self, stream_name, key_properties, replication_key='updated', max_memory_keys=500000, spill_dir=None):
+        self.stream_name = stream_name
+        self.key_properties = list(key_properties or [])
+        self.replication_key = replication_key
+        self.max_memory_keys = max_memory_keys
+        self.spill_dir = spill_dir
+
+        self.seen = set()
+        self.spill = None
+        self.spill_path = None
+        self.spilled = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_config(cls, config, stream_name, key_properties):
+        # Returns None when dedup isn't enabled or the stream has no key properties.
+        if not config.get('dedup') or not key_properties:
+            return None
+        return cls(
+            stream_name,
+            key_properties,
+            max_memory_keys=int(config.get('dedup_memory_keys', 500000)),
+            spill_dir=config.get('dedup_spill_dir')
+        )
+
+    def digest(self, record):
+        identity = '\x1f'.join(str(record.get(key)) for key in self.key_properties)
+        identity += '\x1e' + str(record.get(self.replication_key))
+        return int.from_bytes(hashlib.blake2b(identity.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+    def filter(self, records):
+        """ Returns the records not seen before, in order """
+        digests = [self.digest(record) for record in records]
+
+        # Only the digests not in memory are looked up in the spill file, by batch.
+        spilled = set()
+        if self.spill is not None:
+            candidates = list({digest for digest in digests if digest not in self.seen})
+            for i in range(0, len(candidates), SPILL_QUERY_SIZE):
+                chunk = candidates[i:i + SPILL_QUERY_SIZE]
+                query = 'SELECT digest FROM seen WHERE digest IN ({})'.format(','.join('?' * len(chunk)))
+                spilled.update(row[0] for row in self.spill.execute(query, chunk))
+
+        new_records = []
+        seen = self.seen
+        for record, digest in zip(records, digests):
+            if digest in seen or digest in spilled:
+                continue
+            seen.add(digest)
+            new_records.append(record)
+
+        self.dropped += len(records) - len(new_records)
+        if len(seen) >= self.max_memory_keys:
+            self._spill()
+        return new_records
+
+    def _spill(self):
+        if self.spill is None:
+            fd, self.spill_path = tempfile.mkstemp(prefix=f'tap-sevenrooms-dedup-{self.stream_name}-', suffix='.db', dir=self.spill_dir)
+            os.close(fd)
+            self.spill = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self.spill.execute('PRAGMA journal_mode=OFF')
+            self.spill.execute('PRAGMA synchronous=OFF')
+            self.spill.execute('CREATE TABLE seen (digest INTEGER PRIMARY KEY) WITHOUT ROWID')
+            LOGGER.info(f'Stream: {self.stream_name}, dedup keys spilled to {self.spill_path}')
+
+        self.spill.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((digest,) for digest in self.seen))
+        self.spill.commit()
+        self.spilled += len(self.seen)
+        self.seen = set()
+
+    def close(self):
+        if self.dropped:
+            LOGGER.info(f'Stream: {self.stream_name}, {self.dropped} duplicate records dropped')
+        if self.spill is not None:
+            self.spill.close()
+            os.remove(self.spill_path)
+            self.spill = None
@@ -0,0 +1,98 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Value yielded by unordered_flat_map once every value of an item has been yielded.
+ITEM_DONE = object()
+
+
+def ordered_map(func, items, max_workers=1):
+    """ Yield func(item) for every item, in the order of items.
+
+    Up to max_workers calls run at the same time, and at most max_workers results
+    are waiting to be consumed, so memory stays bounded whatever the number of items.
+    With a single worker the calls are made lazily in the current thread.
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Don't start calls which results will never be consumed.
+            for future in pending:
+                future.cancel()
+
+
+def unordered_flat_map(func, items, max_workers=1):
+    """ Yield (item, value) for every value of the iterable returned by func(item), then (item, ITEM_DONE).
+
+    The iterables of up to max_workers items are consumed at the same time in workers,
+    their values being yielded as soon as they are produced (the values of different
+    items interleave). A worker waits while max_workers values are waiting to be
+    consumed, so memory stays bounded whatever the length of the iterables. With a
+    single worker the iterables are consumed lazily in the current thread, one after another.
+    """
+    if max_workers <= 1:
+        for item in items:
+            for value in func(item):
+                yield item, value
+            yield item, ITEM_DONE
+        return
+
+    items = iter(items)
+    # (item, value, exception) produced by the workers.
+    results = queue.Queue(maxsize=max_workers)
+    stopped = threading.Event()
+
+    def run(item):
+        try:
+            for value in func(item):
+                if stopped.is_set():
+                    return
+                results.put((item, value, None))
+            results.put((item, ITEM_DONE, None))
+        except Exception as exception:
+            results.put((item, None, exception))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        running = 0
+        try:
+            for item in items:
+                futures.append(executor.submit(run, item))
+                running += 1
+                if running >= max_workers:
+                    break
+
+            while running:
+                item, value, exception = results.get()
+                if exception is not None:
+                    raise exception
+                yield item, value
+                if value is ITEM_DONE:
+                    running -= 1
+                    # Keep the pool busy with the next items.
+                    for item in items:
+                        futures.append(executor.submit(run, item))
+                        running += 1
+                        break
+        finally:
+            # The workers waiting to put a value are released, and stop at their next value.
+            stopped.set()
+            while not all(future.done() for future in futures):
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
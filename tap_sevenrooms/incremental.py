@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+import singer
+from singer import utils
+
+
+def parse_datetime(value):
+    # fromisoformat covers the timestamps of the API and is much faster than singer (dateutil), used for the other formats.
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return utils.strptime_to_utc(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+class UpdatedBookmark:
+    """ Tracks the replication key (updated) of an INCREMENTAL stream.
+
+    Rows older than the bookmark saved by the previous run are filtered out, the rows
+    updated at the bookmark itself are kept as they may not have been written yet (the
+    repeated ones are dropped by dedup or the target). The highest value seen is saved
+    once the stream is synced.
+    """
+
+    def __init__(self, state, stream_name, replication_key='updated'):
+        self.stream_name = stream_name
+        self.replication_key = replication_key
+
+        bookmark = singer.get_bookmark(state, stream_name, replication_key)
+        self.bookmark = utils.strptime_to_utc(bookmark) if bookmark else None
+        self.max_value = self.bookmark
+
+    def filter(self, rows):
+        # Returns the rows not older than the bookmark, rows without replication key are kept.
+        new_rows = []
+        for row in rows:
+            value = row.get(self.replication_key)
+            if value:
+                value = parse_datetime(value)
+                if self.bookmark and value < self.bookmark:
+                    continue
+                if not self.max_value or value > self.max_value:
+                    self.max_value = value
+            new_rows.append(row)
+        return new_rows
+
+    def save(self, state):
+        # Only called once every row up to the end date has been written, the bookmark is safe to use for the next run.
+        if self.max_value:
+            singer.write_bookmark(state, self.stream_name, self.replication_key, utils.strftime(self.max_value))
@@ -0,0 +1,198 @@
+import functools
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import singer
+from singer import metrics
+from .streams import STREAMS
+
+LOGGER = singer.get_logger()
+
+# Upper bounds of the buckets of the histograms.
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+ROWS_BUCKETS = (0, 10, 50, 100, 200, 300, 400, float('inf'))
+
+HTTP_REQUEST_DURATION = metrics.Metric.http_request_duration
+HTTP_REQUEST_RETRY = 'http_request_retry'
+BACKOFF_DURATION = 'backoff_duration'
+RATE_LIMITED_DURATION = 'rate_limited_duration'
+PAGE_ROWS = 'page_rows'
+PARSE_DURATION = 'parse_duration'
+TRANSFORM_DURATION = 'transform_duration'
+WRITE_DURATION = 'write_duration'
+RECORD_COUNT = metrics.Metric.record_count
+
+
+@functools.lru_cache(maxsize=None)
+def _endpoint_patterns():
+    # Paths of the streams, the placeholders of the children paths (ex: venues/{}/charges) matching any id.
+    patterns = []
+    for stream_name, endpoint_config in STREAMS.items():
+        patterns.append((endpoint_config.get('path', stream_name), stream_name))
+        for child_stream_name, child_endpoint_config in endpoint_config.get('children', {}).items():
+            patterns.append((child_endpoint_config.get('path', child_stream_name), child_stream_name))
+    return [(re.compile('^' + re.escape(path).replace(r'\{\}', '[^/]+') + '$'), path, stream_name) for path, stream_name in patterns]
+
+
+@functools.lru_cache(maxsize=1024)
+def endpoint_tags(route):
+    """ Returns the endpoint (path of the stream) and stream of a route requested """
+    for pattern, path, stream_name in _endpoint_patterns():
+        if pattern.match(route):
+            return path, stream_name
+    return route, None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'min': self.min,
+            'max': self.max,
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count for bound, count in zip(self.buckets, self.counts) if count},
+        }
+
+
+class SyncMetrics:
+    """ Timings and counts of the sync, logged as Singer METRIC lines (singer.metrics).
+
+    Histograms (request latency per endpoint, rows per page) and counters (retries per
+    exception, seconds rate limited or backing off, parse / transform / write seconds, records) are
+    aggregated by metric and tags. The points aggregated since the previous log are
+    logged every log_interval seconds and by summary(), which also logs the totals of
+    each stream. Shared by all the workers.
+    """
+
+    def __init__(self, log_interval=metrics.DEFAULT_LOG_INTERVAL):
+        self.log_interval = log_interval
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = defaultdict(float)
+        self.stream_totals = defaultdict(lambda: defaultdict(float))
+        self.last_log = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(log_interval=float(config.get('metrics_interval', metrics.DEFAULT_LOG_INTERVAL)))
+
+    def observe(self, metric, value, buckets=DURATION_BUCKETS, stream=None, **tags):
+        if stream:
+            tags['stream'] = stream
+        key = (metric, tuple(sorted(tags.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+            if stream:
+                self.stream_totals[stream][metric] += value
+                self.stream_totals[stream][f'{metric}_count'] += 1
+        self._log_if_ready()
+
+    def increment(self, metric, amount=1, stream=None, **tags):
+        if stream:
+            tags['stream'] = stream
+        key = (metric, tuple(sorted(tags.items())))
+        with self.lock:
+            self.counters[key] += amount
+            if stream:
+                self.stream_totals[stream][metric] += amount
+        self._log_if_ready()
+
+    def timer(self, metric, stream=None, **tags):
+        return _Timer(self, metric, stream, tags)
+
+    def _log_if_ready(self):
+        if time.monotonic() - self.last_log >= self.log_interval:
+            self.log()
+
+    def log(self):
+        """ Logs the points aggregated since the previous log """
+        with self.lock:
+            histograms, self.histograms = self.histograms, {}
+            counters, self.counters = self.counters, defaultdict(float)
+            self.last_log = time.monotonic()
+
+        for (metric, tags), histogram in histograms.items():
+            metrics.log(LOGGER, metrics.Point('histogram', metric, histogram.to_dict(), dict(tags)))
+        for (metric, tags), value in counters.items():
+            value = int(value) if float(value).is_integer() else round(value, 6)
+            metrics.log(LOGGER, metrics.Point('counter', metric, value, dict(tags)))
+
+    def stream_summaries(self):
+        """ Returns the totals of each stream since the start of the sync """
+        with self.lock:
+            stream_totals = {stream: dict(totals) for stream, totals in self.stream_totals.items()}
+
+        summaries = {}
+        for stream, totals in stream_totals.items():
+            summaries[stream] = {
+                'records': int(totals.get(RECORD_COUNT, 0)),
+                'requests': int(totals.get(f'{HTTP_REQUEST_DURATION}_count', 0)),
+                'retries': int(totals.get(HTTP_REQUEST_RETRY, 0)),
+                'pages': int(totals.get(f'{PAGE_ROWS}_count', 0)),
+                'request_seconds': round(totals.get(HTTP_REQUEST_DURATION, 0), 3),
+                'rate_limited_seconds': round(totals.get(RATE_LIMITED_DURATION, 0), 3),
+                'backoff_seconds': round(totals.get(BACKOFF_DURATION, 0), 3),
+                'parse_seconds': round(totals.get(PARSE_DURATION, 0), 3),
+                'transform_seconds': round(totals.get(TRANSFORM_DURATION, 0), 3),
+                'write_seconds': round(totals.get(WRITE_DURATION, 0), 3),
+            }
+        return summaries
+
+    def summary(self):
+        """ Logs the points left and the totals of each stream """
+        self.log()
+        for stream, summary in self.stream_summaries().items():
+            metrics.log(LOGGER, metrics.Point('summary', 'stream_summary', summary, {'stream': stream}))
+
+
+class _Timer:
+    # Observes the seconds spent in the block, tagged with the status of the block like singer.metrics.Timer.
+    def __init__(self, sync_metrics, metric, stream, tags):
+        self.sync_metrics = sync_metrics
+        self.metric = metric
+        self.stream = stream
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        status = metrics.Status.failed if exc_type else metrics.Status.succeeded
+        self.sync_metrics.observe(self.metric, time.perf_counter() - self.start, stream=self.stream, status=status, **self.tags)
+
+
+def on_backoff(details):
+    """ backoff handler of the requests of a client, counts the retries per exception class and the seconds slept """
+    client, route = details['args'][:2]
+    exception = details.get('exception') or sys.exc_info()[1]
+    endpoint, stream = endpoint_tags(route)
+    client.metrics.increment(HTTP_REQUEST_RETRY, stream=stream, endpoint=endpoint, exception=type(exception).__name__)
+    if details.get('wait'):
+        client.metrics.increment(BACKOFF_DURATION, details['wait'], stream=stream, endpoint=endpoint)
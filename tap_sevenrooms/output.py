@@ -0,0 +1,153 @@
+import json
+import sys
+import threading
+import time
+
+from .metrics import RECORD_COUNT, WRITE_DURATION
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_encoder(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def get_encoder(name=None):
+    """ Returns a function encoding a value to JSON bytes: 'orjson' (default when installed) or 'json' """
+    if name is None:
+        name = 'orjson' if orjson else 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise Exception('orjson is required for the orjson json_encoder, install tap-sevenrooms[fast].')
+        return orjson.dumps
+    if name == 'json':
+        return _json_encoder
+    raise Exception(f'Unknown json_encoder: {name}')
+
+
+class MessageWriter:
+    """ Buffered writer of Singer messages.
+
+    Messages are encoded with a fast JSON encoder and written to stdout by chunks of
+    buffer_size bytes instead of one write and flush per message. STATE messages are
+    coalesced: at most one every state_interval seconds, the last one always being written
+    by flush(). As every message goes through the same buffer, a state is always written
+    after the records it covers.
+
+    The writer can be shared by threads, the records of a call to write_records are written
+    together. Hold lock to update the state and write it atomically.
+    """
+
+    def __init__(self, out=None, encoder=None, buffer_size=1024 * 1024, state_interval=1.0, metrics=None):
+        self.out = out
+        self.encode = encoder or get_encoder()
+        self.buffer_size = buffer_size
+        self.state_interval = state_interval
+
+        self.chunks = []
+        self.size = 0
+        self.pending_state = None
+        self.last_state_time = 0.0
+        self.record_prefixes = {}
+        self.lock = threading.RLock()
+
+        # SyncMetrics receiving the records written and the time spent encoding and writing them.
+        self.metrics = metrics
+
+    @classmethod
+    def from_config(cls, config, out=None, metrics=None, **kwargs):
+        # kwargs are the options of the subclasses.
+        return cls(
+            out=out,
+            metrics=metrics,
+            encoder=get_encoder(config.get('json_encoder')),
+            buffer_size=int(config.get('output_buffer_size', 1024 * 1024)),
+            state_interval=float(config.get('state_interval', 1.0)),
+            **kwargs
+        )
+
+    def _write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        if not self.chunks:
+            return
+        out = self.out
+        if out is None:
+            # Anything written to the text layer of stdout goes first.
+            sys.stdout.flush()
+            out = sys.stdout.buffer
+        out.write(b''.join(self.chunks))
+        out.flush()
+        self.chunks = []
+        self.size = 0
+
+    def write_message(self, message):
+        with self.lock:
+            self._write(self.encode(message) + b'\n')
+
+    def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None):
+        message = {'type': 'SCHEMA', 'stream': stream_name, 'schema': schema, 'key_properties': key_properties}
+        if bookmark_properties:
+            message['bookmark_properties'] = bookmark_properties
+        self.write_message(message)
+
+    def write_records(self, stream_name, records):
+        if not records:
+            return
+
+        started = time.perf_counter()
+        # Encoded before taking the lock, other threads keep writing meanwhile.
+        data = self.encode_records(stream_name, records)
+        with self.lock:
+            self._write_records(stream_name, data, len(records))
+
+        if self.metrics is not None:
+            self.metrics.observe(WRITE_DURATION, time.perf_counter() - started, stream=stream_name)
+            self.metrics.increment(RECORD_COUNT, len(records), stream=stream_name)
+
+    def encode_records(self, stream_name, records):
+        # RECORD messages of the records, the prefix of the messages of a stream is only encoded once.
+        prefix = self.record_prefixes.get(stream_name)
+        if prefix is None:
+            prefix = b'{"type":"RECORD","stream":' + self.encode(stream_name) + b',"record":'
+            self.record_prefixes[stream_name] = prefix
+        encode = self.encode
+        return b''.join([prefix + encode(record) + b'}\n' for record in records])
+
+    def _write_records(self, stream_name, data, count):
+        # Called with the lock held.
+        self._write(data)
+
+    def write_state(self, state):
+        with self.lock:
+            self.pending_state = state
+            now = time.monotonic()
+            if now - self.last_state_time >= self.state_interval:
+                self._write_pending_state(now)
+
+    def _write_pending_state(self, now):
+        if self.pending_state is None:
+            return
+        self.write_message({'type': 'STATE', 'value': self.pending_state})
+        self.pending_state = None
+        self.last_state_time = now
+        # The target can commit up to this state.
+        self._flush_buffer()
+
+    def flush(self):
+        with self.lock:
+            self._write_pending_state(time.monotonic())
+            self._flush_buffer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.flush()
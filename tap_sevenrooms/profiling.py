@@ -0,0 +1,161 @@
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Seconds of each phase of a sync, from the totals of SyncMetrics.stream_summaries().
+PHASES = {
+    'fetch': ('request_seconds',),
+    'wait': ('rate_limited_seconds', 'backoff_seconds'),
+    'parse': ('parse_seconds', 'transform_seconds'),
+    'write': ('write_seconds',),
+}
+
+# Before Python 3.12, cProfile only sees the thread it is enabled in, each thread gets its own profiler.
+# From 3.12 it runs on sys.monitoring: the profiler of the main thread sees every thread, and no other can be enabled.
+PROFILE_EACH_THREAD = sys.version_info < (3, 12)
+
+
+def pop_profile_args(argv):
+    """ Removes the --profile options from argv (they aren't Singer arguments) and returns them
+
+    --profile                   profiles the sync
+    --profile-output PATH       file of the profile (implies --profile), tap-sevenrooms-<time>.prof by default
+    --profile-memory            also traces the memory allocations with tracemalloc
+    --profile-top N             functions and allocations in the summary, defaults to 20
+    """
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--profile-output')
+    parser.add_argument('--profile-memory', action='store_true')
+    parser.add_argument('--profile-top', type=int, default=20)
+    options, remaining = parser.parse_known_args(argv[1:])
+    argv[1:] = remaining
+
+    options.profile = options.profile or bool(options.profile_output)
+    return options
+
+
+class SyncProfiler:
+    """ Profiles the code run in the block with cProfile, in every thread started meanwhile.
+
+    The profiles of the threads are merged and written to output (pstats format, ex:
+    python -m pstats or snakeviz), with the tracemalloc snapshot in output.tracemalloc
+    when memory is set. A summary is written to stderr at exit: the seconds of each
+    stream by phase (fetch, wait, parse, write) when metrics are set, then the top
+    functions by own and cumulative time and the top allocations. stdout isn't used.
+    """
+
+    def __init__(self, output=None, memory=False, top=20):
+        self.output = output or f'tap-sevenrooms-{time.strftime("%Y%m%dT%H%M%S")}.prof'
+        self.memory = memory
+        self.top = top
+        # SyncMetrics of the sync, set once the client is created.
+        self.metrics = None
+
+        self.profiler = cProfile.Profile()
+        self.thread_profilers = []
+
+    @classmethod
+    def from_options(cls, options):
+        # Returns None when --profile isn't set.
+        if not options.profile:
+            return None
+        return cls(output=options.profile_output, memory=options.profile_memory, top=options.profile_top)
+
+    def _profile_thread(self, frame, event, arg):
+        # Profile function of the new threads, replaced by a profiler of the thread on its first call.
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active for the whole process, it already sees the thread.
+            return
+        self.thread_profilers.append(profiler)
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        if PROFILE_EACH_THREAD:
+            threading.setprofile(self._profile_thread)
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.profiler.disable()
+        if PROFILE_EACH_THREAD:
+            threading.setprofile(None)
+        elapsed = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+
+        snapshot = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        stats = pstats.Stats(self.profiler, stream=sys.stderr)
+        for profiler in self.thread_profilers:
+            profiler.disable()
+            try:
+                stats.add(profiler)
+            except TypeError:
+                # The thread made no call.
+                pass
+        stats.dump_stats(self.output)
+        if snapshot is not None:
+            snapshot.dump(f'{self.output}.tracemalloc')
+        LOGGER.info(f'Profile written to {os.path.abspath(self.output)}')
+
+        out = io.StringIO()
+        threads = f', {len(self.thread_profilers) + 1} threads' if PROFILE_EACH_THREAD else ''
+        out.write(f'\n=== tap-sevenrooms profile: {elapsed:.3f}s elapsed, {cpu:.3f}s CPU{threads} ===\n')
+        if self.metrics is not None:
+            self._write_phases(out)
+        self._write_functions(out, stats)
+        if snapshot is not None:
+            self._write_allocations(out, snapshot, peak)
+        sys.stderr.write(out.getvalue())
+        sys.stderr.flush()
+
+    def _write_phases(self, out):
+        # Seconds are summed over the workers, they can exceed the elapsed time.
+        summaries = self.metrics.stream_summaries()
+        if not summaries:
+            return
+        columns = ['stream', 'records', 'requests', 'retries'] + list(PHASES)
+        rows = []
+        for stream, summary in sorted(summaries.items()):
+            row = [stream, summary['records'], summary['requests'], summary['retries']]
+            row += [f'{sum(summary[key] for key in keys):.3f}' for keys in PHASES.values()]
+            rows.append([str(value) for value in row])
+        widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+
+        out.write('\nSeconds by stream and phase (summed over the workers):\n')
+        out.write('  '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip() + '\n')
+        for row in rows:
+            out.write('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() + '\n')
+
+    def _write_functions(self, out, stats):
+        stats.stream = out
+        stats.strip_dirs()
+        for sort_key, title in (('tottime', 'own time'), ('cumulative', 'cumulative time')):
+            out.write(f'\nTop {self.top} functions by {title}:\n')
+            stats.sort_stats(sort_key).print_stats(self.top)
+
+    def _write_allocations(self, out, snapshot, peak):
+        out.write(f'\nTop {self.top} allocations (peak traced memory: {peak / 1024 / 1024:.1f} MB):\n')
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            out.write(f'{stat}\n')
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import singer
+
+
+logger = singer.get_logger()
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date.
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_reset(value):
+    # X-RateLimit-Reset is either an epoch timestamp or a number of seconds.
+    if value is None:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e9:
+        reset -= time.time()
+    return max(reset, 0.0)
+
+
+class AdaptiveRateLimiter:
+    """ Token bucket shared by every thread (and coroutine) of a client.
+
+    The rate follows an AIMD policy: it grows by `increase` requests/sec for
+    every second of clean responses and is multiplied by `decrease` on a 429,
+    so it settles just under the real API limit. Retry-After and X-RateLimit-*
+    response headers block the bucket until the API accepts requests again.
+    """
+
+    def __init__(self, rate=10.0, min_rate=0.5, max_rate=100.0, burst=None, increase=0.5, decrease=0.5):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.burst = float(burst) if burst else max(self.rate, 1.0)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_decrease = float('-inf')
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            rate=config.get('rate_limit', 10),
+            min_rate=config.get('min_rate_limit', 0.5),
+            max_rate=config.get('max_rate_limit', 100),
+            burst=config.get('rate_limit_burst')
+        )
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """ Takes a token and returns the seconds to wait before using it """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _block(self, now, seconds):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def on_success(self, headers=None):
+        """ Additive increase, and honor the rate limit headers of a successful response """
+        with self.lock:
+            now = time.monotonic()
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+            if headers is not None and headers.get('X-RateLimit-Remaining') == '0':
+                reset = parse_reset(headers.get('X-RateLimit-Reset'))
+                if reset:
+                    self._block(now, reset)
+
+    def on_throttle(self, headers=None):
+        """ Multiplicative decrease on a 429, the bucket is emptied and blocked for Retry-After """
+        with self.lock:
+            now = time.monotonic()
+
+            # Requests in flight when the limit was hit also get a 429, only slow down once for them.
+            if now - self.last_decrease >= 1.0 / self.rate:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_decrease = now
+                logger.info(f'Rate limited, slowing down to {self.rate:.2f} requests/sec')
+
+            # Tokens refilled since the last request are dropped too, the next request waits for a new one.
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+
+            if headers is not None:
+                retry_after = parse_retry_after(headers.get('Retry-After'))
+                if retry_after is None:
+                    retry_after = parse_reset(headers.get('X-RateLimit-Reset'))
+                if retry_after:
+                    self._block(now, retry_after)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class ResponseCache:
+    """ Responses of the API saved in a SQLite file, compressed.
+
+    Responses are keyed by the credentials, endpoint and params (cursor included). A response
+    whose to_date is at least immutable_days old never expires. The others (today's, or
+    without to_date like the exports) can still change, they are only kept ttl seconds
+    when a ttl is set. When the file grows over max_size bytes, the least recently used
+    responses are evicted.
+    """
+
+    def __init__(self, path, ttl=0, immutable_days=1, max_size=1024 ** 3):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.immutable_days = immutable_days
+        self.max_size = max_size
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Shared by the workers, every access holds the lock.
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, route TEXT, expires_at REAL, accessed_at REAL, size INTEGER, body BLOB)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        # Returns None when no response_cache_path is set.
+        if not config.get('response_cache_path'):
+            return None
+        return cls(
+            config['response_cache_path'],
+            ttl=float(config.get('response_cache_ttl', 0)),
+            # Today's responses are never immutable.
+            immutable_days=max(int(config.get('response_cache_immutable_days', 1)), 1),
+            max_size=int(config.get('response_cache_max_size', 1024 ** 3))
+        )
+
+    @staticmethod
+    def key(base_url, client_id, route, params):
+        return hashlib.sha256(json.dumps([base_url, client_id, route, params], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def expires_at(self, params, now):
+        # Returns when a response expires, None if it never does, 0 if it shouldn't be cached.
+        to_date = (params or {}).get('to_date')
+        if to_date:
+            if datetime.strptime(to_date, '%Y-%m-%d').date() <= datetime.utcnow().date() - timedelta(days=self.immutable_days):
+                return None
+        return now + self.ttl if self.ttl > 0 else 0
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT body FROM responses WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)', (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, route, params, data):
+        now = time.time()
+        expires_at = self.expires_at(params, now)
+        if expires_at == 0:
+            return
+
+        body = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        with self.lock:
+            previous = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses (key, route, expires_at, accessed_at, size, body) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, route, expires_at, now, len(body), body)
+            )
+            self.size += len(body) - (previous[0] if previous else 0)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # Expired responses go first, then the least recently used ones down to 90% of max_size.
+        self.connection.execute('DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        target = self.max_size * 0.9
+        evicted = []
+        if self.size > target:
+            for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall():
+                evicted.append((key,))
+                self.size -= size
+                if self.size <= target:
+                    break
+            self.connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        if evicted:
+            LOGGER.info(f'Response cache: evicted {len(evicted)} responses')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        LOGGER.info(f'Response cache: {self.hits} hits, {self.misses} misses')
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+def run_jobs(jobs, dependencies=None, max_workers=1):
+    """ Run the jobs ({name: callable}), up to max_workers at the same time.
+
+    A job only starts once all the jobs it depends on ({name: [names]}) are done, the
+    others are started in the order of jobs. The first exception raised by a job is
+    re-raised once the running jobs are finished, the jobs not started are dropped.
+    """
+    dependencies = dependencies or {}
+    waiting = list(jobs)
+    done = set()
+
+    def ready():
+        return [name for name in waiting if all(dependency in done or dependency not in jobs for dependency in dependencies.get(name, []))]
+
+    if max_workers <= 1:
+        while waiting:
+            name = ready()[0]
+            waiting.remove(name)
+            jobs[name]()
+            done.add(name)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stream') as executor:
+        running = {}
+        while waiting or running:
+            for name in ready():
+                if len(running) >= max_workers:
+                    break
+                waiting.remove(name)
+                running[executor.submit(jobs[name])] = name
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                error = future.exception()
+                if error:
+                    LOGGER.error(f'Stream {name} failed, waiting for the running streams to finish')
+                    waiting.clear()
+                    wait(running)
+                    raise error
+                done.add(name)
@@ -1,5 +1,6 @@
 import os
 import json
+import functools
 import singer
 from singer import metadata
 from tap_sevenrooms.streams import STREAMS
@@ -19,27 +20,40 @@ def get_schemas():
     for stream_name, stream_metadata in flat_streams.items():
         replication_ind = stream_metadata.get('replication_ind', True)
         if replication_ind:
-            schema_path = get_abs_path('schemas/{}.json'.format(stream_name))
-            with open(schema_path) as file:
-                schema = json.load(file)
-            schemas[stream_name] = schema
+            schemas[stream_name] = load_schema(stream_name)
+            field_metadata[stream_name] = get_field_metadata(stream_name, schemas[stream_name])
+    return schemas, field_metadata
 
-            metadata.new()
 
-            # Documentation:
-            # https://github.com/singer-io/getting-started/blob/master/docs/DISCOVERY_MODE.md#singer-python-helper-functions
-            # Reference:
-            # https://github.com/singer-io/singer-python/blob/master/singer/metadata.py#L25-L44
-            mdata = metadata.get_standard_metadata(
-                schema=schema,
-                key_properties=stream_metadata.get('key_properties', None),
-                valid_replication_keys=stream_metadata.get('replication_keys', None),
-                replication_method=stream_metadata.get('replication_method', None)
-            )
-            field_metadata[stream_name] = mdata
-    return schemas, field_metadata
+# Schema files are only read once per process, the text being parsed again for each caller.
+@functools.lru_cache(maxsize=None)
+def read_schema(stream_name):
+    schema_path = get_abs_path('schemas/{}.json'.format(stream_name))
+    with open(schema_path) as file:
+        return file.read()
+
+
+def load_schema(stream_name):
+    # A new dict every time, callers can modify it.
+    return json.loads(read_schema(stream_name))
+
+
+def get_field_metadata(stream_name, schema=None):
+    stream_metadata = flatten_streams()[stream_name]
+
+    # Documentation:
+    # https://github.com/singer-io/getting-started/blob/master/docs/DISCOVERY_MODE.md#singer-python-helper-functions
+    # Reference:
+    # https://github.com/singer-io/singer-python/blob/master/singer/metadata.py#L25-L44
+    return metadata.get_standard_metadata(
+        schema=schema if schema is not None else load_schema(stream_name),
+        key_properties=stream_metadata.get('key_properties', None),
+        valid_replication_keys=stream_metadata.get('replication_keys', None),
+        replication_method=stream_metadata.get('replication_method', None)
+    )
 
 
+@functools.lru_cache(maxsize=None)
 def flatten_streams():
     # De-nest children nodes for Discovery mode
     flat_streams = {}
@@ -15,6 +15,8 @@ STREAMS = {
         'key_properties': ['id'],
         'replication_method': 'INCREMENTAL',
         'replication_keys': ['updated'],
+        'adaptive_windows': True,
+        'updated_since_param': 'updated_since',
         'params': {
             'venue_group_id': '{}'
         }
@@ -24,6 +26,7 @@ STREAMS = {
         'data_key': 'results',
         'key_properties': ['id'],
         'replication_method': 'FULL_TABLE',
+        'use_dates': False,
         'params': {
             'venue_group_id': '{}'
         },
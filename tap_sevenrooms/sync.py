@@ -0,0 +1,530 @@
+from datetime import datetime, timedelta
+
+import singer
+from singer import utils, metadata
+from .schema import flatten_streams
+from .client import PAGE_LIMIT, MAX_PAGE
+from .executor import ITEM_DONE, ordered_map, unordered_flat_map
+from .scheduler import run_jobs
+from .batch import BatchWriter
+from .change_index import RowHashIndex
+from .dedup import RecordDeduplicator
+from .incremental import UpdatedBookmark
+from .output import MessageWriter
+from .transform import RecordTransformer, prune_schema
+from .venue_groups import VenueGroupWriter, get_venue_group_state, get_venue_groups
+from .windows import adaptive_windows
+from .streams import STREAMS
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+LOGGER = singer.get_logger()
+
+
+# Currently syncing sets the stream currently being delivered in the state.
+# If the integration is interrupted, this state property is used to identify
+#  the starting point to continue from.
+# Reference: https://github.com/singer-io/singer-python/blob/master/singer/bookmarks.py#L41-L46
+def update_currently_syncing(state, stream_name, writer):
+    if (stream_name is None) and ('currently_syncing' in state):
+        del state['currently_syncing']
+    else:
+        singer.set_currently_syncing(state, stream_name)
+    writer.write_state(state)
+
+
+def get_selected_fields(stream):
+    # Get the selected fields used for syncing, None when the catalog doesn't select fields (every field is synced).
+    mdata = metadata.to_map(stream.metadata)
+    fields = [breadcrumb[1] for breadcrumb in mdata if len(breadcrumb) == 2 and breadcrumb[0] == 'properties']
+    if not any('selected' in mdata[('properties', field)] for field in fields):
+        return None
+
+    selected_fields = []
+    for field in fields:
+        field_metadata = mdata[('properties', field)]
+        if field_metadata.get('inclusion') == 'automatic' or field_metadata.get('selected', field_metadata.get('selected-by-default', False)):
+            selected_fields.append(field)
+    return selected_fields
+
+
+def format_params(params, *sources):
+    # If param is format placeholder, use the key to get the value from the first source (config, parent row...) having it.
+    if not params:
+        return None
+
+    formatted = dict(params)
+    for param_key, param_value in params.items():
+        if param_value == '{}':
+            for source in sources:
+                if source.get(param_key):
+                    formatted[param_key] = param_value.format(source[param_key])
+                    break
+    return formatted
+
+
+def get_resume_params(checkpoint, day, to_day):
+    # Cursor and page to resume the request of these dates from, if it was interrupted during the last run.
+    if checkpoint and checkpoint['day'] == day.strftime(DATE_FORMAT) and checkpoint['to_day'] == to_day.strftime(DATE_FORMAT):
+        return dict(cursor=checkpoint['cursor'], page=checkpoint['page'])
+    return {}
+
+
+def write_checkpoint(state, stream_name, day, to_day, page, writer):
+    # Saved after each page, an interrupted sync resumes from the next page instead of the first page of the day.
+    with writer.lock:
+        checkpoints = state.setdefault('checkpoints', {})
+        if page.cursor:
+            checkpoints[stream_name] = {
+                'stream': stream_name,
+                'day': day.strftime(DATE_FORMAT),
+                'to_day': to_day.strftime(DATE_FORMAT),
+                'cursor': page.cursor,
+                'page': page.number + 1
+            }
+        else:
+            checkpoints.pop(stream_name, None)
+        writer.write_state(state)
+
+
+def clear_checkpoint(state, stream_name):
+    checkpoints = state.get('checkpoints', {})
+    checkpoints.pop(stream_name, None)
+    if not checkpoints:
+        state.pop('checkpoints', None)
+
+
+def get_updated_bookmark(state, stream_name, endpoint_config):
+    # INCREMENTAL streams only emit the rows updated since the previous run.
+    if endpoint_config.get('replication_method') == 'INCREMENTAL' and endpoint_config.get('replication_keys'):
+        return UpdatedBookmark(state, stream_name, endpoint_config['replication_keys'][0])
+    return None
+
+
+def select_records(stream_name, rows, bookmarks, deduplicators):
+    # Rows not newer than the bookmark of the stream, and the ones already written during the run, are dropped.
+    bookmark = bookmarks.get(stream_name)
+    if bookmark:
+        rows = bookmark.filter(rows)
+    deduplicator = deduplicators.get(stream_name)
+    if deduplicator:
+        rows = deduplicator.filter(rows)
+    return rows
+
+
+def sync_children(client, config, state, stream_name, endpoint_config, children_to_sync, rows, day, bookmarks, deduplicators, transformers, fetched, writer):
+    # Handle the child streams and get the data for those
+    parent_id_field = endpoint_config.get('key_properties')
+    if not parent_id_field:
+        return
+
+    # Number of child requests running at the same time.
+    child_workers = int(config.get('child_workers', 1))
+
+    def child_requests():
+        for row in rows:
+            # We are using the parent ID in the path or other settings of the child.
+            parent_id = row.get(parent_id_field[0])
+            if not parent_id:
+                continue
+
+            for child_stream, child_endpoint_config, child_start_day in children_to_sync:
+                # Child path is written with {} in the place of where the parent ID should go.
+                # we can use .format() to insert the parent ID into the URL route.
+                child_path = child_endpoint_config.get('path', child_stream.tap_stream_id).format(str(parent_id))
+
+                # This is any additionnal params that may be used for the request to the API
+                child_params = format_params(child_endpoint_config.get('params'), config, row)
+
+                # A parent repeated (in several pages, or days) is only fetched once per run for the same dates.
+                key = (child_stream.tap_stream_id, child_path, tuple(sorted((child_params or {}).items())), child_start_day or day, day)
+                if key in fetched:
+                    continue
+                fetched.add(key)
+
+                yield parent_id, child_path, child_params, child_stream, child_endpoint_config, child_start_day
+
+    def fetch_child(child_request):
+        parent_id, child_path, child_params, child_stream, child_endpoint_config, child_start_day = child_request
+        LOGGER.info(f'Syncing: {child_stream.tap_stream_id}, parent_stream: {stream_name}, parent_id: {parent_id}')
+
+        child_data_key = child_endpoint_config.get('data_key', 'results')
+        child_transformer = transformers.get(child_stream.tap_stream_id)
+
+        if child_start_day is None:
+            child_pages = client.request_pages(
+                stream=child_stream,
+                endpoint=child_path,
+                data_key=child_data_key,
+                day=day,
+                additional_params=child_params,
+                transformer=child_transformer
+            )
+        else:
+            # The parent isn't iterated by date, every day since the last sync of the child is requested by windows of days.
+            def fetch_window(from_day, to_day, max_page):
+                return client.request_pages(stream=child_stream, endpoint=child_path, data_key=child_data_key, day=from_day, end_day=to_day,
+                                            additional_params=child_params, raise_on_max_page=True, max_page=max_page, transformer=child_transformer)
+
+            max_days = int(config.get('max_window_days', 31))
+            windows = adaptive_windows(
+                fetch_window,
+                child_start_day,
+                day,
+                max_days=max_days,
+                target_rows=int(config.get('window_target_rows', PAGE_LIMIT * MAX_PAGE // 3)),
+                first_days=max_days
+            )
+            child_pages = (page for _, _, window_pages in windows for page in window_pages)
+        return child_pages
+
+    # Children of all the parents of the page are fetched concurrently, each page is written as soon as it is received
+    # (a worker only holds the page, or window of several days, being fetched).
+    for (parent_id, _, _, child_stream, _, child_start_day), child_tap_data in unordered_flat_map(fetch_child, child_requests(), max_workers=child_workers):
+        if child_tap_data is not ITEM_DONE:
+            # write one or more rows to the stream:
+            writer.write_records(child_stream.tap_stream_id, select_records(child_stream.tap_stream_id, child_tap_data, bookmarks, deduplicators))
+            continue
+
+        if child_start_day is not None:
+            # Saved by the parent once every parent has been synced.
+            continue
+
+        with writer.lock:
+            state[child_stream.tap_stream_id] = day.strftime(DATE_FORMAT)
+            writer.write_state(state)
+
+
+def sync(client, config, state, catalog):
+    """ Sync data from tap source """
+
+    # Messages are buffered, everything left is written when the sync ends (or fails).
+    # With a batch_dir, records are written to files referenced by BATCH messages.
+    writer_class = BatchWriter if config.get('batch_dir') else MessageWriter
+    with writer_class.from_config(config, metrics=client.metrics) as writer:
+        try:
+            sync_streams(client, config, state, catalog, writer)
+        finally:
+            # Where the time of the sync was spent, by stream.
+            client.metrics.summary()
+
+
+def sync_streams(client, config, state, catalog, writer):
+
+    # Get selected_streams from catalog, based on state last_stream
+    #   last_stream = Previous currently synced stream, if the load was interrupted
+    last_stream = singer.get_currently_syncing(state)
+    LOGGER.info(f'last/currently syncing stream: {last_stream}')
+
+    selected_streams = []
+    flat_streams = flatten_streams()
+
+    # Loop over selected streams in catalog
+    for stream in catalog.get_selected_streams(state):
+        selected_streams.append(stream.stream)
+        parent_stream = flat_streams.get(stream.stream, {}).get('parent_stream')
+        if parent_stream and parent_stream not in selected_streams:
+            selected_streams.append(parent_stream)
+    LOGGER.info(f'selected_streams: {selected_streams}')
+
+    if not selected_streams:
+        return
+
+    jobs = {}
+    dependencies = {}
+    venue_groups = get_venue_groups(config)
+    if venue_groups is None:
+        add_stream_jobs(jobs, dependencies, client, config, state, catalog, writer, selected_streams)
+    else:
+        # Every venue group is synced in this run, their streams sharing the workers and the connection pool.
+        group_clients = {}
+        for venue_group in venue_groups:
+            venue_group_id = venue_group['venue_group_id']
+            credentials = (venue_group['client_id'], venue_group['client_secret'])
+            if credentials not in group_clients:
+                group_clients[credentials] = client.with_credentials(*credentials)
+
+            group_config = dict(config, **venue_group)
+            group_state = get_venue_group_state(state, venue_group_id)
+            group_writer = VenueGroupWriter(writer, state, venue_group_id)
+            add_stream_jobs(jobs, dependencies, group_clients[credentials], group_config, group_state, catalog, group_writer, selected_streams,
+                            prefix=f'{venue_group_id}/')
+
+    # Independent streams run at the same time, in the order of STREAMS with a single worker.
+    run_jobs(jobs, dependencies, max_workers=int(config.get('stream_workers', 1)))
+
+
+def add_stream_jobs(jobs, dependencies, client, config, state, catalog, writer, selected_streams, prefix=''):
+    flat_streams = flatten_streams()
+
+    # Streams running at the same time, currently_syncing is the first one of them still running.
+    running = []
+
+    def stream_job(stream_name, endpoint_config):
+        def job():
+            with writer.lock:
+                running.append(stream_name)
+                update_currently_syncing(state, running[0], writer)
+
+            sync_stream(client, config, state, catalog, writer, stream_name, endpoint_config, selected_streams)
+
+            with writer.lock:
+                running.remove(stream_name)
+                update_currently_syncing(state, running[0] if running else None, writer)
+        return job
+
+    # Children are synced by their parent, each top level stream is a job. A top level stream
+    # having a parent_stream (none for now) only starts once its parent is synced.
+    for stream_name, endpoint_config in STREAMS.items():
+        if stream_name in selected_streams:
+            jobs[prefix + stream_name] = stream_job(stream_name, endpoint_config)
+            parent_stream = flat_streams.get(stream_name, {}).get('parent_stream')
+            if parent_stream in STREAMS and parent_stream in selected_streams:
+                dependencies[prefix + stream_name] = [prefix + parent_stream]
+
+
+def sync_stream(client, config, state, catalog, writer, stream_name, endpoint_config, selected_streams):
+    stream = catalog.get_stream(stream_name)
+    LOGGER.info(f"Syncing stream: {stream_name}")
+
+    # replication_ind defaults to True, set to False when you shouldn't replicate parent
+    replication_ind = endpoint_config.get('replication_ind', True)
+
+    # FULL_TABLE streams only emit the rows changed since the previous runs when a change_index_path is set.
+    row_index = RowHashIndex.from_config(config, state, stream_name, stream.key_properties, endpoint_config) if replication_ind else None
+
+    if replication_ind:
+        selected_fields = get_selected_fields(stream)
+        LOGGER.info(f'Stream: {stream_name}, selected_fields: {selected_fields}')
+        # Unselected fields are dropped by the transformer, the schema only describes the fields emitted.
+        schema = prune_schema(stream.schema.to_dict(), selected_fields)
+        if row_index:
+            schema = row_index.schema_with_tombstones(schema)
+        writer.write_schema(
+            stream_name=stream.tap_stream_id,
+            schema=schema,
+            key_properties=stream.key_properties,
+        )
+    else:
+        selected_fields = None
+
+    # Schemas of the stream and its children, compiled once to transform the rows.
+    transformers = {}
+    if replication_ind:
+        transformers[stream_name] = RecordTransformer(stream_name, stream.schema.to_dict(), selected_fields)
+
+    # Bookmarks on the replication key of the stream and its children.
+    bookmarks = {}
+    bookmark = get_updated_bookmark(state, stream_name, endpoint_config)
+    if bookmark:
+        bookmarks[stream_name] = bookmark
+
+    # Here we loop through any children streams and lookup info for each row.
+    children = endpoint_config.get('children')
+    children_to_sync = []
+    if children:
+        for child_stream_name, child_endpoint_config in children.items():
+            if child_stream_name in selected_streams:
+                # replication_ind defaults to True, set to False when you shouldn't replicate child
+                child_replication_ind = child_endpoint_config.get('replication_ind', True)
+                if child_replication_ind:
+
+                    child_stream = catalog.get_stream(child_stream_name)
+
+                    child_selected_fields = get_selected_fields(child_stream)
+                    LOGGER.info(f'Stream: {child_stream_name}, selected_fields: {child_selected_fields}')
+
+                    writer.write_schema(
+                        stream_name=child_stream_name,
+                        schema=prune_schema(child_stream.schema.to_dict(), child_selected_fields),
+                        key_properties=child_stream.key_properties,
+                    )
+
+                    # Children of a parent not iterated by date, but requested by date, start from their own last synced day.
+                    child_start_day = None
+                    if not endpoint_config.get('use_dates', True) and child_endpoint_config.get('use_dates', True):
+                        child_start_day = utils.strptime_to_utc(state.get(child_stream_name) or config.get('start_date'))
+
+                    # Add the stream and it's config data to the list of children
+                    children_to_sync.append((child_stream, child_endpoint_config, child_start_day))
+
+                    transformers[child_stream_name] = RecordTransformer(child_stream_name, child_stream.schema.to_dict(), child_selected_fields)
+
+                    child_bookmark = get_updated_bookmark(state, child_stream_name, child_endpoint_config)
+                    if child_bookmark:
+                        bookmarks[child_stream_name] = child_bookmark
+
+    # Records already written during the run are dropped when dedup is enabled.
+    deduplicators = {}
+    for deduplicated_stream_name in transformers:
+        deduplicator = RecordDeduplicator.from_config(config, deduplicated_stream_name, catalog.get_stream(deduplicated_stream_name).key_properties)
+        if deduplicator:
+            deduplicators[deduplicated_stream_name] = deduplicator
+
+    try:
+        sync_windows(client, config, state, catalog, writer, stream, endpoint_config, transformers, bookmarks, deduplicators, children_to_sync, row_index)
+    finally:
+        for deduplicator in deduplicators.values():
+            deduplicator.close()
+        if row_index:
+            row_index.close()
+
+
+def sync_windows(client, config, state, catalog, writer, stream, endpoint_config, transformers, bookmarks, deduplicators, children_to_sync, row_index=None):
+    # Number of days fetched at the same time for streams iterated by date.
+    day_workers = int(config.get('day_workers', 1))
+
+    stream_name = stream.tap_stream_id
+    path = endpoint_config.get('path', stream_name)
+
+    # Key used in the response array.
+    data_key = endpoint_config.get('data_key', 'results')
+
+    # This is used to determine if we are using to_date from_date in the query params
+    use_dates = endpoint_config.get('use_dates', True)
+
+    # This is any additionnal params that may be used for the request to the API
+    params = format_params(endpoint_config.get('params'), config)
+
+    transformer = transformers.get(stream_name)
+    bookmark = bookmarks.get(stream_name)
+
+    today = datetime.now()
+    day = state.get(stream.tap_stream_id) or config.get('start_date')
+    end_date = config['end_date'][:10] if 'end_date' in config and config['end_date'] else today.strftime(DATE_FORMAT)
+
+    day = utils.strptime_to_utc(day)
+    end_date = utils.strptime_to_utc(end_date)
+
+    # Checkpoint of the request interrupted during the last run, read before the pages of this run replace it.
+    checkpoint = state.get('checkpoints', {}).get(stream_name)
+
+    LOGGER.info(f'Sync data from {day} to {end_date}')
+
+    # Parameter of the endpoint to only request the rows updated since a date.
+    updated_since_param = endpoint_config.get('updated_since_param')
+
+    if bookmark and bookmark.bookmark and updated_since_param:
+        # The stream has been synced up to end date before, only the updates since then are requested.
+        LOGGER.info(f'Sync data updated since {bookmark.bookmark}')
+        updated_params = dict(params or {})
+        updated_params[updated_since_param] = bookmark.bookmark.strftime(DATETIME_FORMAT)
+        # Every update is paged, the bookmark moves past the rows of the last page.
+        pages = client.request_pages(stream=stream, endpoint=path, data_key=data_key, day=end_date, use_dates=False, additional_params=updated_params,
+                                     transformer=transformer, max_page=None, **get_resume_params(checkpoint, end_date, end_date))
+        windows = [(end_date, end_date, pages)]
+    elif use_dates and endpoint_config.get('adaptive_windows') and config.get('adaptive_windows'):
+        # Windows are sized from the rows of the previous one, so they are fetched one after another.
+        def fetch_window(from_day, to_day, max_page):
+            return client.request_pages(stream=stream, endpoint=path, data_key=data_key, day=from_day, end_day=to_day,
+                                        additional_params=params, raise_on_max_page=True, max_page=max_page,
+                                        transformer=transformer, **get_resume_params(checkpoint, from_day, to_day))
+
+        # An interrupted window is resumed with the same dates.
+        first_days = 1
+        if checkpoint:
+            day = utils.strptime_to_utc(checkpoint['day'])
+            first_days = (utils.strptime_to_utc(checkpoint['to_day']) - day).days + 1
+
+        windows = adaptive_windows(
+            fetch_window,
+            day,
+            end_date,
+            max_days=int(config.get('max_window_days', 31)),
+            target_rows=int(config.get('window_target_rows', PAGE_LIMIT * MAX_PAGE // 3)),
+            first_days=first_days
+        )
+    else:
+        if use_dates:
+            # The days before the interrupted one were written, the sync resumes from it.
+            if checkpoint:
+                checkpoint_day = utils.strptime_to_utc(checkpoint['day'])
+                if day < checkpoint_day <= end_date:
+                    day = checkpoint_day
+
+            days = []
+            while day <= end_date:
+                days.append(day)
+                day += timedelta(days=1)
+        else:
+            # The case of items not iterable by date then skip to end_date and don't include params in request
+            days = [end_date]
+
+        # Several days are fetched concurrently, a single one (or the whole export) is streamed page by page.
+        workers = day_workers if use_dates and len(days) > 1 else 1
+
+        def fetch_day(day):
+            pages = client.request_pages(stream=stream, endpoint=path, data_key=data_key, day=day, use_dates=use_dates, additional_params=params,
+                                         transformer=transformer, **get_resume_params(checkpoint, day, day))
+            if workers > 1:
+                # Fetched in a worker, the day is buffered until all the previous days are written.
+                return list(pages)
+            return pages
+
+        # Days are fetched concurrently but always written in order.
+        windows = ((day, day, pages) for day, pages in zip(days, ordered_map(fetch_day, days, max_workers=workers)))
+
+    # Child requests already made during the run.
+    fetched = set()
+
+    # Every row of the stream was received, unless a window was empty, resumed from a checkpoint or cut at MAX_PAGE.
+    complete = True
+    # A window was cut at MAX_PAGE, its rows past the last page were not received.
+    truncated = False
+
+    # We sync the fields for each day (or window of days)
+    for day, to_day, pages in windows:
+        first_page = last_page = None
+
+        # Pages are written as soon as they are received, only one page is kept in memory.
+        for tap_data in pages:
+            if first_page is None:
+                first_page = tap_data
+            last_page = tap_data
+
+            records = select_records(stream.tap_stream_id, tap_data, bookmarks, deduplicators)
+            if row_index:
+                records = row_index.filter(records)
+            # write one or more rows to the stream:
+            writer.write_records(stream.tap_stream_id, records)
+
+            if children_to_sync:
+                sync_children(client, config, state, stream_name, endpoint_config, children_to_sync, tap_data, day, bookmarks, deduplicators, transformers, fetched, writer)
+
+            write_checkpoint(state, stream_name, day, to_day, tap_data, writer)
+
+        if last_page is not None and last_page.cursor:
+            truncated = True
+        if first_page is None or first_page.number != 1 or truncated:
+            complete = False
+
+        # Every previous day has been written, the bookmark can move past this one.
+        with writer.lock:
+            clear_checkpoint(state, stream_name)
+            state[stream.tap_stream_id] = to_day.strftime(DATE_FORMAT)
+            for child_stream, _, child_start_day in children_to_sync:
+                if child_start_day is not None:
+                    state[child_stream.tap_stream_id] = to_day.strftime(DATE_FORMAT)
+            writer.write_state(state)
+
+    # Everything up to the end date has been written, the next run only needs what was updated after this.
+    # The rows past MAX_PAGE may be older than the highest value seen, the bookmark doesn't move past them.
+    with writer.lock:
+        if truncated:
+            LOGGER.warning(f'Stream: {stream_name}, rows were dropped past MAX_PAGE, the bookmarks are not saved')
+        else:
+            for stream_bookmark in bookmarks.values():
+                stream_bookmark.save(state)
+        writer.write_state(state)
+
+    if row_index:
+        # The rows gone since the previous run are only known once every row has been received.
+        if complete and row_index.tombstones:
+            for tombstones in row_index.deleted_records():
+                writer.write_records(stream.tap_stream_id, tombstones)
+        elif not complete:
+            LOGGER.info(f'Stream: {stream_name}, not every row was received, the rows gone are kept in the change index')
+        # The rows staged are promoted by the run starting from this state, the target has loaded them by then.
+        with writer.lock:
+            row_index.save(state, complete)
+            writer.write_state(state)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import singer
+from singer import utils
+
+LOGGER = singer.get_logger()
+
+
+def parse_token_expiry(data):
+    """ Returns the expiry (epoch seconds) of the token returned by /auth, None when the API doesn't give one """
+    expiration = data.get('token_expiration_datetime') or data.get('expires_at')
+    if expiration:
+        try:
+            return utils.strptime_to_utc(expiration).timestamp()
+        except (ValueError, OverflowError):
+            LOGGER.warning(f'Unknown token expiration format: {expiration!r}')
+    expires_in = data.get('expires_in')
+    if expires_in:
+        return time.time() + float(expires_in)
+    return None
+
+
+class TokenCache:
+    """ API tokens saved in a JSON file and reused across runs.
+
+    Tokens are stored by a hash of the base url and credentials (the secret is never
+    written) with their expiry. The file is only readable by its owner and replaced
+    atomically, a missing or unreadable file is an empty cache.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(base_url, client_id, client_secret):
+        return hashlib.sha256(f'{base_url}\n{client_id}\n{client_secret}'.encode('utf-8')).hexdigest()
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                tokens = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return tokens if isinstance(tokens, dict) else {}
+
+    def get(self, key, margin=0):
+        # Returns (token, expires_at) if a token valid for at least margin seconds is cached.
+        with self.lock:
+            entry = self._read().get(key)
+        if not entry or not entry.get('token'):
+            return None
+        expires_at = entry.get('expires_at')
+        if expires_at is not None and expires_at - margin <= time.time():
+            return None
+        return entry['token'], expires_at
+
+    def set(self, key, token, expires_at):
+        with self.lock:
+            tokens = self._read()
+            # Expired tokens of other credentials are dropped.
+            now = time.time()
+            tokens = {k: v for k, v in tokens.items() if v.get('expires_at') is None or v['expires_at'] > now}
+            tokens[key] = {'token': token, 'expires_at': expires_at}
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            try:
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(tokens, file)
+                os.replace(tmp_path, self.path)
+            except OSError as error:
+                # The sync doesn't depend on the cache.
+                LOGGER.warning(f'Could not write the token cache {self.path}: {error}')
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
@@ -0,0 +1,218 @@
+import singer
+
+LOGGER = singer.get_logger()
+
+# Returned by a coercer when the value doesn't match the schema, the value is then dropped.
+INVALID = object()
+
+
+def _types(schema):
+    types = schema.get('type', [])
+    if isinstance(types, str):
+        types = [types]
+    return [t for t in types if t != 'null']
+
+
+def _coerce_string(value):
+    if type(value) is str:
+        return value
+    if type(value) in (int, float):
+        return str(value)
+    return INVALID
+
+
+def _coerce_integer(value):
+    if type(value) is int:
+        return value
+    if type(value) is float and value.is_integer():
+        return int(value)
+    if type(value) is str:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return INVALID
+
+
+def _coerce_number(value):
+    if type(value) in (int, float):
+        return value
+    if type(value) is str:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return INVALID
+
+
+def _coerce_boolean(value):
+    if type(value) is bool:
+        return value
+    if type(value) is str and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    if type(value) is int and value in (0, 1):
+        return bool(value)
+    return INVALID
+
+
+def _keep(value):
+    return value
+
+
+def compile_object(schema, selected_fields=None):
+    """ Returns the plan of an object schema: {key: coercer} for the properties kept """
+    properties = schema.get('properties', {})
+    return {
+        key: compile_schema(property_schema)
+        for key, property_schema in properties.items()
+        if selected_fields is None or key in selected_fields
+    }
+
+
+def prune_schema(schema, selected_fields=None):
+    """ Returns a copy of the schema with only the selected properties """
+    if selected_fields is None:
+        return schema
+    pruned = dict(schema)
+    pruned['properties'] = {
+        key: property_schema
+        for key, property_schema in schema.get('properties', {}).items()
+        if key in selected_fields
+    }
+    return pruned
+
+
+def compile_schema(schema):
+    """ Compiles a JSON schema once into a coercer, a function returning the value converted to the schema or INVALID """
+    if 'anyOf' in schema:
+        branches = [compile_schema(branch) for branch in schema['anyOf'] if _types(branch)]
+        if not branches:
+            return _keep
+
+        def coerce_any_of(value):
+            for coerce in branches:
+                coerced = coerce(value)
+                if coerced is not INVALID:
+                    return coerced
+            return INVALID
+        return branches[0] if len(branches) == 1 else coerce_any_of
+
+    types = _types(schema)
+
+    if 'object' in types:
+        if schema.get('additionalProperties', True) is not False and not schema.get('properties'):
+            # Free form object (ex: custom_fields), kept as is.
+            return lambda value: value if type(value) is dict else INVALID
+
+        plan = compile_object(schema)
+        keep_unknown = schema.get('additionalProperties', True) is not False
+
+        def coerce_object(value):
+            if type(value) is not dict:
+                return INVALID
+            return transform_row(plan, value, keep_unknown)
+        return coerce_object
+
+    if 'array' in types:
+        coerce_item = compile_schema(schema['items']) if schema.get('items') else _keep
+
+        def coerce_array(value):
+            if type(value) is not list:
+                return INVALID
+            items = []
+            for item in value:
+                if item is None:
+                    items.append(None)
+                    continue
+                item = coerce_item(item)
+                if item is not INVALID:
+                    items.append(item)
+            return items
+        return coerce_array
+
+    coercers = []
+    for schema_type in types:
+        if schema_type == 'string':
+            coercers.append(_coerce_string)
+        elif schema_type == 'integer':
+            coercers.append(_coerce_integer)
+        elif schema_type == 'number':
+            coercers.append(_coerce_number)
+        elif schema_type == 'boolean':
+            coercers.append(_coerce_boolean)
+
+    if not coercers:
+        return _keep
+    if len(coercers) == 1:
+        return coercers[0]
+
+    # The value is kept as is when its type is one of the types allowed, otherwise it is converted to the first one possible.
+    python_types = {'string': (str,), 'integer': (int,), 'number': (int, float), 'boolean': (bool,)}
+    allowed = tuple({python_type for schema_type in types for python_type in python_types.get(schema_type, ())})
+
+    def coerce_union(value):
+        if type(value) in allowed:
+            return value
+        for coerce in coercers:
+            coerced = coerce(value)
+            if coerced is not INVALID:
+                return coerced
+        return INVALID
+    return coerce_union
+
+
+def transform_row(plan, row, keep_unknown=False):
+    # Nested objects keep their None values.
+    record = {}
+    for key, value in row.items():
+        coerce = plan.get(key)
+        if coerce is None:
+            if keep_unknown:
+                record[key] = value
+            continue
+        if value is not None:
+            value = coerce(value)
+        if value is not INVALID:
+            record[key] = value
+    return record
+
+
+class RecordTransformer:
+    """ Converts the rows of the API to records of a stream schema.
+
+    The schema is compiled once into a plan, each row is then transformed in a single
+    pass: None values and keys unknown to the schema (or not selected) are dropped,
+    values are coerced to the schema types and values not matching it are dropped.
+    """
+
+    def __init__(self, stream_name, schema, selected_fields=None):
+        self.stream_name = stream_name
+        self.plan = compile_object(schema, selected_fields)
+
+        # The date of the request is added to the rows of streams with a date property.
+        self.date_field = 'date' in self.plan
+        self.invalid_fields = set()
+
+    def transform(self, rows, date):
+        plan = self.plan
+        records = []
+        for row in rows:
+            record = {'date': date} if self.date_field else {}
+            for key, value in row.items():
+                if value is None:
+                    continue
+                coerce = plan.get(key)
+                if coerce is None:
+                    continue
+                coerced = coerce(value)
+                if coerced is INVALID:
+                    self.log_invalid(key, value)
+                    continue
+                record[key] = coerced
+            records.append(record)
+        return records
+
+    def log_invalid(self, key, value):
+        if key not in self.invalid_fields:
+            self.invalid_fields.add(key)
+            LOGGER.warning(f'Stream: {self.stream_name}, value of {key} does not match the schema and is dropped: {value!r}')
@@ -0,0 +1,65 @@
+def get_venue_groups(config):
+    """ Returns the venue groups to sync, [{'venue_group_id', 'client_id', 'client_secret'}], None for a single venue_group_id """
+    venue_groups = config.get('venue_groups')
+    if not venue_groups:
+        return None
+
+    # A comma separated list of venue_group_id is accepted too.
+    if isinstance(venue_groups, str):
+        venue_groups = [venue_group.strip() for venue_group in venue_groups.split(',') if venue_group.strip()]
+
+    groups = []
+    for venue_group in venue_groups:
+        if not isinstance(venue_group, dict):
+            venue_group = {'venue_group_id': venue_group}
+        if not venue_group.get('venue_group_id'):
+            raise Exception(f'No venue_group_id provided in venue_groups: {venue_group}')
+        # Groups without credentials of their own use the ones of the config.
+        groups.append({
+            'venue_group_id': str(venue_group['venue_group_id']),
+            'client_id': venue_group.get('client_id', config.get('client_id')),
+            'client_secret': venue_group.get('client_secret', config.get('client_secret')),
+        })
+
+    venue_group_ids = [group['venue_group_id'] for group in groups]
+    if len(set(venue_group_ids)) != len(venue_group_ids):
+        raise Exception('A venue group is listed several times in venue_groups.')
+    return groups
+
+
+def get_venue_group_state(state, venue_group_id):
+    # Bookmarks, checkpoints and currently_syncing of a venue group are namespaced under state['venue_groups'].
+    return state.setdefault('venue_groups', {}).setdefault(venue_group_id, {})
+
+
+class VenueGroupWriter:
+    """ MessageWriter of the streams of one venue group.
+
+    Records are tagged with the venue_group_id of the group (added to the schema if
+    the catalog didn't select it). The streams of a group update the state of the group,
+    any state written emits the whole state of the run.
+    """
+
+    def __init__(self, writer, state, venue_group_id):
+        self.writer = writer
+        self.state = state
+        self.venue_group_id = venue_group_id
+        self.lock = writer.lock
+
+    def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None):
+        if 'venue_group_id' not in schema.get('properties', {}):
+            schema = dict(schema)
+            schema['properties'] = dict(schema.get('properties', {}), venue_group_id={'type': ['null', 'string']})
+        self.writer.write_schema(stream_name, schema, key_properties, bookmark_properties)
+
+    def write_records(self, stream_name, records):
+        venue_group_id = self.venue_group_id
+        for record in records:
+            record['venue_group_id'] = venue_group_id
+        self.writer.write_records(stream_name, records)
+
+    def write_state(self, state):
+        self.writer.write_state(self.state)
+
+    def flush(self):
+        self.writer.flush()
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+import singer
+from .client import SevenroomMaxPageError, PAGE_LIMIT, MAX_PAGE
+
+LOGGER = singer.get_logger()
+
+
+class PageCounter:
+    """ Iterates over pages, counting the rows as they are consumed """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.rows = 0
+
+    def __iter__(self):
+        for page in self.pages:
+            self.rows += len(page)
+            yield page
+
+
+def adaptive_windows(fetch, start, end, max_days=31, target_rows=PAGE_LIMIT * MAX_PAGE // 3, first_days=1):
+    """ Yield (from_day, to_day, pages) covering start to end with windows sized to the data.
+
+    fetch(from_day, to_day, max_page) returns the pages of a window, raising SevenroomMaxPageError
+    past max_page pages (None for no limit). The window doubles while windows return less than
+    half of target_rows and halves when they return more. A window of several days reaching
+    MAX_PAGE is split in half and re-fetched, its pages are buffered (at most MAX_PAGE pages)
+    until it is known to be complete. Single day windows can't be split, they are streamed
+    without page limit so busy days are never truncated. The first window is first_days long.
+    """
+    days = first_days
+    day = start
+    while day <= end:
+        to_day = min(day + timedelta(days=days - 1), end)
+        window_days = (to_day - day).days + 1
+
+        if window_days > 1:
+            try:
+                pages = PageCounter(list(fetch(day, to_day, MAX_PAGE)))
+            except SevenroomMaxPageError:
+                days = (window_days + 1) // 2
+                LOGGER.info(f'Too many rows from {day:%Y-%m-%d} to {to_day:%Y-%m-%d}, splitting in windows of {days} days')
+                continue
+        else:
+            pages = PageCounter(fetch(day, to_day, None))
+
+        yield day, to_day, pages
+
+        if pages.rows < target_rows / 2:
+            days = min(max_days, window_days * 2)
+        elif pages.rows > target_rows:
+            days = max(1, window_days // 2)
+        else:
+            days = window_days
+
+        day = to_day + timedelta(days=1)
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from tap_sevenrooms.change_index import RowHashIndex
+
+
+class TestPromotion(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'index.db')
+
+    def run_sync(self, state, rows):
+        # Returns the rows emitted and the state written at the end of the stream.
+        state = dict(state)
+        index = RowHashIndex(self.path, 'clients', ['id'])
+        try:
+            index.promote(state.get('change_index', {}).get('clients'))
+            emitted = index.filter(rows)
+            index.save(state, complete=True)
+        finally:
+            index.close()
+        return emitted, state
+
+    def test_rows_are_promoted_once_the_state_is_handed_back(self):
+        rows = [{'id': i} for i in range(3)]
+        emitted, failed_state = self.run_sync({}, rows)
+        self.assertEqual(emitted, rows)
+
+        # The target failed: the next run starts from the previous state and emits the rows again.
+        emitted, loaded_state = self.run_sync({}, rows)
+        self.assertEqual(emitted, rows)
+
+        # The target loaded them, a state handed back twice promotes its rows once.
+        emitted, _ = self.run_sync(loaded_state, rows)
+        self.assertEqual(emitted, [])
+        emitted, state = self.run_sync(loaded_state, rows)
+        self.assertEqual(emitted, [])
+
+        emitted, _ = self.run_sync(state, rows + [{'id': 3}])
+        self.assertEqual(emitted, [{'id': 3}])
+
+        # The rows of a generation discarded aren't promoted by its state anymore.
+        emitted, _ = self.run_sync(failed_state, rows)
+        self.assertEqual(emitted, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from tap_sevenrooms import discover
+
+
+class TestDiscover(unittest.TestCase):
+
+    def test_catalogs_are_independent(self):
+        # Selecting streams and fields in a catalog doesn't change the next ones.
+        catalog = discover()
+        for stream in catalog.streams:
+            for entry in stream.metadata:
+                entry['metadata']['selected'] = False
+            stream.schema.properties.pop('id', None)
+
+        fresh = discover()
+        for stream in fresh.streams:
+            self.assertIn('id', stream.schema.properties)
+            for entry in stream.metadata:
+                self.assertNotIn('selected', entry['metadata'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import threading
+import unittest
+
+from tap_sevenrooms.executor import ITEM_DONE, unordered_flat_map
+
+
+class TestUnorderedFlatMap(unittest.TestCase):
+
+    def test_values_then_done(self):
+        for max_workers in (1, 3):
+            with self.subTest(max_workers=max_workers):
+                results = list(unordered_flat_map(lambda item: range(item), range(6), max_workers=max_workers))
+
+                for item in range(6):
+                    values = [value for result_item, value in results if result_item == item]
+                    self.assertEqual(values, list(range(item)) + [ITEM_DONE])
+
+    def test_values_waiting_are_bounded(self):
+        # The workers stop producing while max_workers values wait to be consumed.
+        produced = []
+        lock = threading.Lock()
+
+        def values(item):
+            for value in range(100):
+                with lock:
+                    produced.append(value)
+                yield value
+
+        results = unordered_flat_map(values, range(2), max_workers=2)
+        consumed = 0
+        for _, value in results:
+            if value is not ITEM_DONE:
+                consumed += 1
+            with lock:
+                self.assertLessEqual(len(produced) - consumed, 2 * 2 + 1)
+
+    def test_exception_is_raised(self):
+        def values(item):
+            yield item
+            raise ValueError(item)
+
+        with self.assertRaises(ValueError):
+            list(unordered_flat_map(values, range(4), max_workers=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
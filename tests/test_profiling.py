@@ -0,0 +1,49 @@
+import contextlib
+import io
+import os
+import pstats
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from tap_sevenrooms import profiling
+from tap_sevenrooms.profiling import SyncProfiler
+
+
+def busy_worker(n):
+    return sum(i * i for i in range(n))
+
+
+class TestSyncProfiler(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'sync.prof')
+
+    def test_profiles_a_thread_pool(self):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            with SyncProfiler(output=self.output):
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    futures = [executor.submit(busy_worker, 10000) for _ in range(8)]
+                    # The workers run, a worker dying on the profiler would leave its futures pending.
+                    results = [future.result(timeout=30) for future in futures]
+
+        self.assertEqual(results, [busy_worker(10000)] * 8)
+        functions = {function for _, _, function in pstats.Stats(self.output).stats}
+        self.assertIn('busy_worker', functions)
+        self.assertIn('tap-sevenrooms profile', stderr.getvalue())
+
+    def test_thread_profiler_refused(self):
+        # Python 3.12+ only allows one profiler per process, the thread runs without its own.
+        profiler = SyncProfiler(output=self.output)
+        with mock.patch.object(profiling.cProfile.Profile, 'enable', side_effect=ValueError('Another profiling tool is already active')):
+            profiler._profile_thread(None, 'call', None)
+
+        self.assertEqual(profiler.thread_profilers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+from email.utils import formatdate
+from unittest import mock
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from tap_sevenrooms import rate_limit
+from tap_sevenrooms.client import SevenRoomsClient
+from tap_sevenrooms.rate_limit import AdaptiveRateLimiter, parse_reset, parse_retry_after
+
+# Epoch of the fake clock when its monotonic time is 0.
+EPOCH = 1600000000
+
+
+class FakeClock:
+    """ Stands for the time module in rate_limit, sleep() moves the clock """
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return EPOCH + self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class ClockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestHeaders(ClockTestCase):
+
+    def test_retry_after(self):
+        self.assertEqual(parse_retry_after('12'), 12.0)
+        self.assertEqual(parse_retry_after('-3'), 0.0)
+        self.assertEqual(parse_retry_after(formatdate(EPOCH + 30, usegmt=True)), 30.0)
+        self.assertEqual(parse_retry_after(formatdate(EPOCH - 30, usegmt=True)), 0.0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_reset(self):
+        # Seconds, or an epoch timestamp.
+        self.assertEqual(parse_reset('20'), 20.0)
+        self.assertEqual(parse_reset(str(EPOCH + 45)), 45.0)
+        self.assertEqual(parse_reset(str(EPOCH - 45)), 0.0)
+        self.assertIsNone(parse_reset('soon'))
+        self.assertIsNone(parse_reset(None))
+
+
+class TestAdaptiveRateLimiter(ClockTestCase):
+
+    def test_burst_then_rate(self):
+        limiter = AdaptiveRateLimiter(rate=2, burst=2)
+        self.assertEqual([limiter.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+
+        # The bucket refills at the rate.
+        self.clock.now += 1.5
+        self.assertEqual(limiter.reserve(), 0.0)
+
+    def test_additive_increase(self):
+        limiter = AdaptiveRateLimiter(rate=4, max_rate=4.2, increase=0.5)
+        limiter.on_success()
+        self.assertEqual(limiter.rate, 4.125)
+        limiter.on_success()
+        limiter.on_success()
+        self.assertEqual(limiter.rate, 4.2)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveRateLimiter(rate=8, min_rate=1.5, decrease=0.5)
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4.0)
+
+        # The 429 of the requests in flight only slow down once.
+        self.clock.now += 0.2
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4.0)
+
+        self.clock.now += 0.05
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 2.0)
+
+        self.clock.now += 1
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 1.5)
+
+    def test_throttle_empties_the_bucket(self):
+        limiter = AdaptiveRateLimiter(rate=4, burst=4)
+        limiter.on_throttle()
+        self.assertEqual(limiter.reserve(), 0.5)
+
+    def test_retry_after_blocks(self):
+        for value, blocked in (('5', 5.0), (formatdate(EPOCH + 10, usegmt=True), 10.0)):
+            with self.subTest(retry_after=value):
+                limiter = AdaptiveRateLimiter(rate=4)
+                limiter.on_throttle({'Retry-After': value})
+                self.assertEqual(limiter.blocked_until, blocked)
+                self.assertEqual(limiter.reserve(), blocked)
+
+    def test_throttle_falls_back_to_the_reset(self):
+        limiter = AdaptiveRateLimiter(rate=4)
+        limiter.on_throttle({'Retry-After': 'soon', 'X-RateLimit-Reset': '7'})
+        self.assertEqual(limiter.blocked_until, 7.0)
+
+    def test_remaining_requests_exhausted(self):
+        for reset, blocked in (('30', 30.0), (str(EPOCH + 20), 20.0)):
+            with self.subTest(reset=reset):
+                limiter = AdaptiveRateLimiter(rate=4)
+                limiter.on_success({'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': reset})
+                self.assertEqual(limiter.blocked_until, 0.0)
+
+                limiter.on_success({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': reset})
+                self.assertEqual(limiter.blocked_until, blocked)
+                self.assertEqual(limiter.reserve(), blocked)
+
+    def test_blocks_never_shorten(self):
+        limiter = AdaptiveRateLimiter(rate=4)
+        limiter.on_throttle({'Retry-After': '10'})
+        limiter.on_throttle({'Retry-After': '2'})
+        self.assertEqual(limiter.blocked_until, 10.0)
+
+        self.clock.now += 4
+        self.assertEqual(limiter.reserve(), 6.0)
+
+
+def response(status_code, body, headers=None):
+    res = requests.Response()
+    res.status_code = status_code
+    res._content = body
+    res.headers = CaseInsensitiveDict(headers or {})
+    return res
+
+
+class FakeSession:
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+class TestTooManyRequests(ClockTestCase):
+
+    def test_429_is_retried_after_the_limiter_wait(self):
+        client = SevenRoomsClient({'client_id': 'id', 'client_secret': 'secret', 'rate_limit': 4})
+        client.get_token = lambda: 'token'
+        client.s = FakeSession([
+            response(429, b'{"msg": "slow down"}', {'Retry-After': '3'}),
+            response(429, b'{"msg": "slow down"}'),
+            response(200, b'{"data": {"results": [{"id": 1}]}}'),
+        ])
+
+        data = client.fetch_data('reservations/export', {})
+
+        self.assertEqual(data, {'results': [{'id': 1}]})
+        self.assertEqual(client.s.requests, 3)
+        # Blocked for Retry-After, then a token at the decreased rate.
+        self.assertEqual(self.clock.slept, [3.0, 1.0])
+        # Halved by each 429, then increased by the response received.
+        self.assertEqual(client.rate_limiter.rate, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
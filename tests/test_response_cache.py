@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from tap_sevenrooms.response_cache import ResponseCache
+
+
+def date(days_ago):
+    return (datetime.utcnow().date() - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def cache(self, **config):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = ResponseCache.from_config(dict(config, response_cache_path=os.path.join(directory.name, 'responses.db')))
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_only_past_days_are_cached_by_default(self):
+        cache = self.cache()
+        responses = {
+            'yesterday': {'from_date': date(1), 'to_date': date(1)},
+            'today': {'from_date': date(0), 'to_date': date(0)},
+            'window to today': {'from_date': date(3), 'to_date': date(0)},
+            'export': {'venue_group_id': 'group'},
+        }
+        for name, params in responses.items():
+            cache.set(name, 'reservations/export', params, {'results': [name]})
+
+        self.assertEqual(cache.get('yesterday'), {'results': ['yesterday']})
+        for name in ('today', 'window to today', 'export'):
+            with self.subTest(response=name):
+                self.assertIsNone(cache.get(name))
+
+    def test_ttl_caches_the_responses_which_can_change(self):
+        cache = self.cache(response_cache_ttl=60, response_cache_immutable_days=0)
+        cache.set('today', 'reservations/export', {'to_date': date(0)}, {'results': []})
+
+        self.assertIsNotNone(cache.get('today'))
+        # Kept for the ttl only, today's responses are never immutable.
+        self.assertIsNotNone(cache.connection.execute('SELECT expires_at FROM responses').fetchone()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import json
+import unittest
+from types import SimpleNamespace
+
+from tap_sevenrooms.client import Page
+from tap_sevenrooms.output import MessageWriter
+from tap_sevenrooms.streams import STREAMS
+from tap_sevenrooms.sync import sync_windows
+
+
+class FakeClient:
+    """ Returns pages of rows_per_page rows for every day, the cursor being the offset of the next page """
+
+    def __init__(self, pages_per_day=4, rows_per_page=400):
+        self.pages_per_day = pages_per_day
+        self.rows_per_page = rows_per_page
+        self.requests = []
+        self.pages_yielded = 0
+
+    def request_pages(self, day=None, cursor=None, page=1, **kwargs):
+        date = day.strftime('%Y-%m-%d')
+        self.requests.append((date, cursor, page))
+        while page <= self.pages_per_day:
+            self.pages_yielded += 1
+            rows = [{'id': f'{date}-{page}-{i}'} for i in range(self.rows_per_page)]
+            next_cursor = str(page * self.rows_per_page) if page < self.pages_per_day else None
+            yield Page(rows, page, next_cursor)
+            page += 1
+
+
+class TestCheckpointResume(unittest.TestCase):
+
+    def sync(self, day_workers):
+        client = FakeClient()
+        config = {'start_date': '2021-01-01', 'end_date': '2021-01-02', 'day_workers': day_workers}
+        # Interrupted during the second day, after its page 2.
+        state = {
+            'reservations': '2021-01-01',
+            'checkpoints': {'reservations': {'stream': 'reservations', 'day': '2021-01-02', 'to_day': '2021-01-02', 'cursor': '800', 'page': 3}}
+        }
+        endpoint_config = dict(STREAMS['reservations'], params=None)
+        out = io.BytesIO()
+        writer = MessageWriter(out=out, encoder=lambda value: json.dumps(value).encode('utf-8'))
+
+        sync_windows(client, config, state, None, writer, SimpleNamespace(tap_stream_id='reservations'), endpoint_config, {}, {}, {}, [])
+        writer.flush()
+
+        records = [message for message in map(json.loads, out.getvalue().splitlines()) if message['type'] == 'RECORD']
+        return client.requests, records, state
+
+    def test_resumes_the_interrupted_day(self):
+        for day_workers in (1, 4):
+            with self.subTest(day_workers=day_workers):
+                requests, records, state = self.sync(day_workers)
+
+                # The interrupted day is resumed from its checkpoint, not restarted from its first page.
+                self.assertEqual(requests, [('2021-01-02', '800', 3)])
+                self.assertEqual(len(records), 2 * 400)
+                self.assertEqual(records[0]['record']['id'], '2021-01-02-3-0')
+                self.assertEqual(state['reservations'], '2021-01-02')
+                self.assertNotIn('checkpoints', state)
+
+
+
+class TestExportStreaming(unittest.TestCase):
+
+    def test_export_is_not_buffered_by_the_day_workers(self):
+        client = FakeClient()
+        config = {'start_date': '2021-01-01', 'end_date': '2021-01-02', 'day_workers': 4}
+        endpoint_config = dict(STREAMS['clients'], params=None)
+        out = io.BytesIO()
+        writer = MessageWriter(out=out, encoder=lambda value: json.dumps(value).encode('utf-8'))
+
+        # Pages received when each page is written.
+        received = []
+        write_records = writer.write_records
+
+        def record_writes(stream_name, records):
+            received.append(client.pages_yielded)
+            write_records(stream_name, records)
+
+        writer.write_records = record_writes
+        sync_windows(client, config, {}, None, writer, SimpleNamespace(tap_stream_id='clients'), endpoint_config, {}, {}, {}, [])
+
+        # The whole export is a single request, its pages are written as they are received.
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(received, [1, 2, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from tap_sevenrooms import windows
+from tap_sevenrooms.client import SevenroomMaxPageError
+from tap_sevenrooms.windows import adaptive_windows
+
+ROWS_PER_PAGE = 10
+
+
+class FakeApi:
+    """ Pages ROWS_PER_PAGE rows of the days requested, raising SevenroomMaxPageError past max_page like request_pages """
+
+    def __init__(self, rows_per_day):
+        self.rows_per_day = rows_per_day
+        self.requests = []
+
+    def fetch(self, from_day, to_day, max_page):
+        self.requests.append((from_day, to_day, max_page))
+        rows = []
+        day = from_day
+        while day <= to_day:
+            rows += [(day, i) for i in range(self.rows_per_day.get(day, 0))]
+            day += timedelta(days=1)
+
+        for page, offset in enumerate(range(0, len(rows), ROWS_PER_PAGE), 1):
+            if max_page is not None and page > max_page:
+                raise SevenroomMaxPageError(f'Max page {max_page}/{max_page} reached')
+            yield rows[offset:offset + ROWS_PER_PAGE]
+
+
+def day(number):
+    return datetime(2021, 1, 1) + timedelta(days=number - 1)
+
+
+@mock.patch.object(windows, 'MAX_PAGE', 3)
+class TestAdaptiveWindows(unittest.TestCase):
+
+    def sync(self, api, start, end, **kwargs):
+        # Returns the windows and their pages, consumed in order like sync_windows.
+        return [(from_day, to_day, list(pages)) for from_day, to_day, pages in adaptive_windows(api.fetch, start, end, **kwargs)]
+
+    def test_days_are_covered_once(self):
+        # Day 5 has too many rows for a window, day 12 is too busy for MAX_PAGE alone.
+        rows_per_day = {day(number): 4 for number in range(1, 21)}
+        rows_per_day[day(5)] = 25
+        rows_per_day[day(12)] = 75
+        api = FakeApi(rows_per_day)
+
+        result = self.sync(api, day(1), day(20), max_days=8, target_rows=20)
+
+        covered = []
+        for from_day, to_day, _ in result:
+            self.assertLessEqual(from_day, to_day)
+            covered += [from_day + timedelta(days=i) for i in range((to_day - from_day).days + 1)]
+        self.assertEqual(covered, [day(number) for number in range(1, 21)])
+
+        # Every row is received, once.
+        rows = [row for _, _, pages in result for page in pages for row in page]
+        self.assertEqual(len(rows), len(set(rows)))
+        self.assertEqual(len(rows), sum(rows_per_day.values()))
+
+    def test_windows_split_down_to_single_days(self):
+        api = FakeApi({day(1): 5, day(2): 5, day(3): 35, day(4): 5})
+
+        result = self.sync(api, day(1), day(4), first_days=4)
+
+        # 4 days, then 2, then single days once day 3 is reached.
+        self.assertEqual(api.requests[:3], [(day(1), day(4), 3), (day(1), day(2), 3), (day(3), day(4), 3)])
+        self.assertIn((day(3), day(3), None), api.requests)
+        self.assertEqual([(from_day, to_day) for from_day, to_day, _ in result][:2], [(day(1), day(2)), (day(3), day(3))])
+
+    def test_single_days_are_paged_without_limit(self):
+        api = FakeApi({day(1): 75})
+
+        result = self.sync(api, day(1), day(1))
+
+        self.assertEqual(api.requests, [(day(1), day(1), None)])
+        self.assertEqual(len(result[0][2]), 8)
+
+    def test_windows_follow_the_rows(self):
+        api = FakeApi({day(number): 2 for number in range(1, 31)})
+
+        result = self.sync(api, day(1), day(30), max_days=8, target_rows=20)
+
+        # Quiet days double the windows up to max_days.
+        self.assertEqual([(to_day - from_day).days + 1 for from_day, to_day, _ in result], [1, 2, 4, 8, 8, 7])
+
+
+if __name__ == '__main__':
+    unittest.main()